@@ -90,6 +90,14 @@ export input_NWM_Flows=$inputDataDir/nwm_hydrofabric/nwm_flows.gpkg
 export input_NWM_Headwaters=$inputDataDir/nwm_hydrofabric/nwm_headwaters.gpkg
 export input_NHD_Flowlines=$inputDataDir/nhdplus_vectors_aggregate/NHDPlusBurnLineEvent_wVAA.gpkg
 
+## Use HUC4 partitioned vector layers when written in preprocessing ##
+input_vector_partitions=$inputDataDir/huc4_vector_partitions
+[ -d $input_vector_partitions/nwm_lakes ] && export input_NWM_Lakes=$input_vector_partitions/nwm_lakes
+[ -d $input_vector_partitions/nwm_catchments ] && export input_NWM_Catchments=$input_vector_partitions/nwm_catchments
+[ -d $input_vector_partitions/nwm_flows ] && export input_NWM_Flows=$input_vector_partitions/nwm_flows
+[ -d $input_vector_partitions/nwm_headwaters ] && export input_NWM_Headwaters=$input_vector_partitions/nwm_headwaters
+[ -d $input_vector_partitions/nhd_burnlines ] && export input_NHD_Flowlines=$input_vector_partitions/nhd_burnlines
+
 ## Input handling ##
 $libDir/check_huc_inputs.py -u "$hucList"
 
@@ -6,8 +6,11 @@ import csv
 import sys
 import shutil
 from multiprocessing import Pool
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import geopandas as gp
-from urllib.error import HTTPError
+import numpy as np
+from urllib.error import HTTPError, URLError
+from http.client import HTTPException
 
 from utils.shared_variables import (NHD_URL_PARENT,
                                     NHD_URL_PREFIX,
@@ -22,16 +25,34 @@ from utils.shared_variables import (NHD_URL_PARENT,
                                     OVERWRITE_NHD,
                                     OVERWRITE_ALL)
 
-from utils.shared_functions import pull_file, run_system_command, subset_wbd_gpkg, delete_file
+from utils.shared_functions import pull_file, pull_file_resumable, DownloadManifest, run_system_command, subset_wbd_gpkg, delete_file
     
 NHDPLUS_VECTORS_DIRNAME = 'nhdplus_vectors'
 NHDPLUS_RASTERS_DIRNAME = 'nhdplus_rasters'
 NWM_HYDROFABRIC_DIRNAME = 'nwm_hydrofabric'
 NWM_FILE_TO_SUBSET_WITH = 'nwm_flows.gpkg'
+DOWNLOAD_MANIFEST_FILENAME = 'download_manifest.json'
 
 def subset_wbd_to_nwm_domain(wbd,nwm_file_to_use):
-    
-    intersecting_indices = [not (gp.read_file(nwm_file_to_use,mask=b).empty) for b in wbd.geometry]
+    """
+    Keeps WBD polygons intersecting NWM flows with one bulk spatial index query.
+
+    Args:
+        wbd (GeoDataFrame): WBD polygons.
+        nwm_file_to_use (str or GeoDataFrame): NWM flows file or NWM flows already loaded. Pass loaded flows to reuse their spatial index across WBD layers.
+
+    """
+
+    if isinstance(nwm_file_to_use,str):
+        nwm_file_to_use = gp.read_file(nwm_file_to_use)
+
+    if nwm_file_to_use.crs != wbd.crs:
+        nwm_file_to_use = nwm_file_to_use.to_crs(wbd.crs)
+
+    wbd_indices, _ = nwm_file_to_use.sindex.query_bulk(wbd.geometry,predicate='intersects')
+
+    intersecting_indices = np.zeros(len(wbd),dtype=bool)
+    intersecting_indices[wbd_indices] = True
     
     return(wbd[intersecting_indices])
 
@@ -69,6 +90,11 @@ def pull_and_prepare_wbd(path_to_saved_data_parent_dir,nwm_dir_name,nwm_file_to_
             os.system("7za x {pulled_wbd_zipped_path} -o{wbd_directory}".format(pulled_wbd_zipped_path=pulled_wbd_zipped_path, wbd_directory=wbd_directory))
         
         procs_list, wbd_gpkg_list = [], []
+
+        # Load NWM flows once so all WBD layers are subset against the same spatial index.
+        nwm_flows = gp.read_file(nwm_file_to_use)
+        nwm_flows = nwm_flows.to_crs(PREP_PROJECTION)
+
         multilayer_wbd_geopackage = os.path.join(wbd_directory, 'WBD_National.gpkg')
         # Add fossid to HU8, project, and convert to geopackage. Code block from Brian Avant.
         if os.path.isfile(multilayer_wbd_geopackage):
@@ -82,7 +108,7 @@ def pull_and_prepare_wbd(path_to_saved_data_parent_dir,nwm_dir_name,nwm_file_to_
         wbd_hu8[FOSS_ID] = fossids
         wbd_hu8 = wbd_hu8.to_crs(PREP_PROJECTION)  # Project.
         #wbd_hu8.to_file(os.path.join(wbd_directory, 'WBDHU8.gpkg'), driver='GPKG')  # Save.
-        wbd_hu8 = subset_wbd_to_nwm_domain(wbd_hu8,nwm_file_to_use)
+        wbd_hu8 = subset_wbd_to_nwm_domain(wbd_hu8,nwm_flows)
         wbd_hu8.geometry = wbd_hu8.buffer(0)
         wbd_hu8.to_file(multilayer_wbd_geopackage, driver='GPKG',layer='WBDHU8')  # Save.
         wbd_hu8.HUC8.to_csv(nwm_huc_list_file_template.format('8'),index=False,header=False)
@@ -96,7 +122,7 @@ def pull_and_prepare_wbd(path_to_saved_data_parent_dir,nwm_dir_name,nwm_file_to_
             wbd = gp.read_file(wbd_gdb_path,layer=wbd_layer)
             wbd = wbd.to_crs(PREP_PROJECTION)
             wbd = wbd.rename(columns={'huc'+wbd_layer_num : 'HUC' + wbd_layer_num})
-            wbd = subset_wbd_to_nwm_domain(wbd,nwm_file_to_use)
+            wbd = subset_wbd_to_nwm_domain(wbd,nwm_flows)
             wbd.geometry = wbd.buffer(0)
             wbd.to_file(multilayer_wbd_geopackage,driver="GPKG",layer=wbd_layer)
             wbd['HUC{}'.format(wbd_layer_num)].to_csv(nwm_huc_list_file_template.format(wbd_layer_num),index=False,header=False)
@@ -153,33 +179,62 @@ def pull_and_prepare_nwm_hydrofabric(path_to_saved_data_parent_dir, path_to_prei
     pool.close()
         
 
-def pull_and_prepare_nhd_data(args):
+def parse_nhd_procs(args):
     """
-    This helper function is designed to be multiprocessed. It pulls and unzips NHD raster and vector data.
-    
+    This helper function parses an entry of the NHD procs list.
+
     Args:
-        args (list): A list of arguments in this format: [nhd_raster_download_url, nhd_raster_extraction_path, nhd_vector_download_url, nhd_vector_extraction_path]
-        
+        args (list): A list of arguments in this format: [nhd_raster_download_url, nhd_raster_extraction_path, nhd_vector_download_url, nhd_vector_extraction_path, overwrite_nhd]
+
     """
-    
-    # Parse urls and extraction paths from procs_list.
-    nhd_raster_download_url = args[0]
-    nhd_raster_extraction_path = args[1]
-    nhd_vector_download_url = args[2]
-    nhd_vector_extraction_path = args[3]
-    overwrite_nhd = args[4]
-    
-    nhd_gdb = nhd_vector_extraction_path.replace('.zip', '.gdb')  # Update extraction path from .zip to .gdb. 
 
-    # Download raster and vector, if not already in user's directory (exist check performed by pull_file()).
-    nhd_raster_extraction_parent = os.path.dirname(nhd_raster_extraction_path)
-    
+    nhd_raster_download_url, nhd_raster_extraction_path, nhd_vector_download_url, nhd_vector_extraction_path, overwrite_nhd = args
+
     huc = nhd_raster_extraction_path.split('_')[3]
-    nhd_raster_parent_dir = os.path.join(nhd_raster_extraction_parent, 'HRNHDPlusRasters' + huc)
+    nhd_raster_parent_dir = os.path.join(os.path.dirname(nhd_raster_extraction_path), 'HRNHDPlusRasters' + huc)
     elev_cm_tif = os.path.join(nhd_raster_parent_dir, 'elev_cm.tif')
+    nhd_gdb = nhd_vector_extraction_path.replace('.zip', '.gdb')  # Update extraction path from .zip to .gdb.
+
+    pull_raster = not os.path.exists(elev_cm_tif) or overwrite_nhd
+    pull_vector = not os.path.exists(nhd_gdb) or overwrite_nhd  # Only pull if not already pulled and processed.
+
+    return(huc, nhd_raster_parent_dir, nhd_gdb, pull_raster, pull_vector)
 
-    if not os.path.exists(elev_cm_tif) or overwrite_nhd:
-        pull_file(nhd_raster_download_url, nhd_raster_extraction_path)
+
+def pull_nhd_data(args, manifest):
+    """
+    This helper function is designed to be threaded. It pulls NHD raster and vector archives that have not been processed yet.
+    Interrupted pulls are resumed and completed pulls recorded in the manifest are not pulled again.
+
+    Args:
+        args (list): A list of arguments in this format: [nhd_raster_download_url, nhd_raster_extraction_path, nhd_vector_download_url, nhd_vector_extraction_path, overwrite_nhd]
+        manifest (DownloadManifest): Records of pulled files.
+
+    """
+
+    nhd_raster_download_url, nhd_raster_extraction_path, nhd_vector_download_url, nhd_vector_extraction_path, overwrite_nhd = args
+    huc, nhd_raster_parent_dir, nhd_gdb, pull_raster, pull_vector = parse_nhd_procs(args)
+
+    if pull_raster:
+        pull_file_resumable(nhd_raster_download_url, nhd_raster_extraction_path, manifest, overwrite_nhd)
+
+    if pull_vector:
+        pull_file_resumable(nhd_vector_download_url, nhd_vector_extraction_path, manifest, overwrite_nhd)
+
+
+def prepare_nhd_data(args):
+    """
+    This helper function is designed to be multiprocessed. It unzips pulled NHD raster and vector data and converts the vectors to geopackage.
+
+    Args:
+        args (list): A list of arguments in this format: [nhd_raster_download_url, nhd_raster_extraction_path, nhd_vector_download_url, nhd_vector_extraction_path, overwrite_nhd]
+
+    """
+
+    nhd_raster_download_url, nhd_raster_extraction_path, nhd_vector_download_url, nhd_vector_extraction_path, overwrite_nhd = args
+    huc, nhd_raster_parent_dir, nhd_gdb, pull_raster, pull_vector = parse_nhd_procs(args)
+
+    if pull_raster:
         os.system("7za e {nhd_raster_extraction_path} -o{nhd_raster_parent_dir} elev_cm.tif -r ".format(nhd_raster_extraction_path=nhd_raster_extraction_path, nhd_raster_parent_dir=nhd_raster_parent_dir))
         # Change projection for elev_cm.tif.
         #print("Projecting elev_cm...")
@@ -196,9 +251,8 @@ def pull_and_prepare_nhd_data(args):
         os.remove(nhd_raster_extraction_path)
         
     nhd_vector_extraction_parent = os.path.dirname(nhd_vector_extraction_path)
-    if not os.path.exists(nhd_gdb) or overwrite_nhd:  # Only pull if not already pulled and processed.
-        # Download and fully unzip downloaded GDB.
-        pull_file(nhd_vector_download_url, nhd_vector_extraction_path)
+    if pull_vector:
+        # Fully unzip downloaded GDB.
         huc = os.path.split(nhd_vector_extraction_parent)[1]  # Parse HUC.
         os.system("7za x {nhd_vector_extraction_path} -o{nhd_vector_extraction_parent}".format(nhd_vector_extraction_path=nhd_vector_extraction_path, nhd_vector_extraction_parent=nhd_vector_extraction_parent))
         
@@ -282,6 +336,7 @@ def manage_preprocessing(hucs_of_interest, num_workers=1,overwrite_nhd=False, ov
     
     Args:
         hucs_of_interest (str): Path to a user-supplied config file of hydrologic unit codes to be pulled and post-processed.
+        num_workers (int): Number of concurrent pulls and of processes unzipping and converting pulled data.
         
     """
 
@@ -340,14 +395,29 @@ def manage_preprocessing(hucs_of_interest, num_workers=1,overwrite_nhd=False, ov
         # Append extraction instructions to nhd_procs_list.
         nhd_procs_list.append([nhd_raster_download_url, nhd_raster_extraction_path, nhd_vector_download_url, nhd_vector_extraction_path, overwrite_nhd])
         
-    # Pull and prepare NHD data.
-    #pool = Pool(num_workers)
-    #pool.map(pull_and_prepare_nhd_data, nhd_procs_list)
-    for huc in nhd_procs_list:
-        try:
-            pull_and_prepare_nhd_data(huc)
-        except HTTPError:
-            print("404 error for HUC4 {}".format(huc))
+    # Pull NHD data with threads and prepare each HUC4 in a process as soon as its pulls finish.
+    manifest = DownloadManifest(os.path.join(path_to_saved_data_parent_dir, DOWNLOAD_MANIFEST_FILENAME))
+    preparations = []
+    with Pool(num_workers) as pool, ThreadPoolExecutor(max_workers=num_workers) as downloader:
+        pulls = {downloader.submit(pull_nhd_data, nhd_procs, manifest) : nhd_procs for nhd_procs in nhd_procs_list}
+        for pull in as_completed(pulls):
+            huc = parse_nhd_procs(pulls[pull])[0]
+            # A failed HUC4 is reported and skipped. Its partial pulls are resumed on the next run.
+            try:
+                pull.result()
+            except HTTPError as e:
+                print("HTTP error {} for HUC4 {}".format(e.code, huc))
+                continue
+            except (URLError, HTTPException, OSError, ValueError) as e:
+                print("Pull failed for HUC4 {}: {!r}".format(huc, e))
+                continue
+            preparations.append((huc, pool.apply_async(prepare_nhd_data, (pulls[pull],))))
+
+        for huc, preparation in preparations:
+            try:
+                preparation.get()
+            except Exception as e:
+                print("Preparation failed for HUC4 {}: {!r}".format(huc, e))
     
     # Pull and prepare NWM data.
     #pull_and_prepare_nwm_hydrofabric(path_to_saved_data_parent_dir, path_to_preinputs_dir,num_workers)  # Commented out for now.
@@ -364,7 +434,7 @@ if __name__ == '__main__':
     # Parse arguments.
     parser = argparse.ArgumentParser(description='Acquires and preprocesses WBD and NHD data for use in fim_run.sh.')
     parser.add_argument('-u','--hucs-of-interest',help='HUC4, series of HUC4s, or path to a line-delimited file of HUC4s to acquire.',required=True,nargs='+')
-    #parser.add_argument('-j','--num-workers',help='Number of workers to process with',required=False,default=1,type=int)
+    parser.add_argument('-j','--num-workers',help='Number of workers to process with',required=False,default=1,type=int)
     parser.add_argument('-n', '--overwrite-nhd', help='Optional flag to overwrite NHDPlus Data',required=False,action='store_true')
     parser.add_argument('-w', '--overwrite-wbd', help='Optional flag to overwrite WBD Data',required=False,action='store_true')
     
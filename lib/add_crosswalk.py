@@ -2,10 +2,12 @@
 
 import geopandas as gpd
 import pandas as pd
-from numpy import unique
 import json
 import argparse
 import sys
+from os.path import splitext
+from utils.shared_functions import write_typed_table, write_src_json
+from utils.shared_variables import HYDRO_TABLE_DTYPES, CROSSWALK_TABLE_DTYPES, SRC_TABLE_DTYPES
 
 input_catchments_fileName = sys.argv[1]
 input_flows_fileName = sys.argv[2]
@@ -53,13 +55,14 @@ with open(mannings_json, "r") as read_file:
 output_flows['ManningN'] = output_flows['order_'].astype(str).map(mannings_dict)
 
 # calculate src_full
-input_src_base = pd.read_csv(input_srcbase_fileName, dtype= object)
+input_src_base = pd.read_csv(input_srcbase_fileName)
+input_src_base = input_src_base.rename(columns=lambda x: x.strip(" "))
 if input_src_base.CatchId.dtype != 'int': input_src_base.CatchId = input_src_base.CatchId.astype(int)
 
 input_src_base = input_src_base.merge(output_flows[['ManningN','HydroID']],left_on='CatchId',right_on='HydroID')
 
-input_src_base = input_src_base.rename(columns=lambda x: x.strip(" "))
-input_src_base = input_src_base.apply(pd.to_numeric,**{'errors' : 'coerce'})
+object_columns = input_src_base.select_dtypes(include='object').columns
+input_src_base[object_columns] = input_src_base[object_columns].apply(pd.to_numeric,**{'errors' : 'coerce'})
 input_src_base['TopWidth (m)'] = input_src_base['SurfaceArea (m2)']/input_src_base['LENGTHKM']/1000
 input_src_base['WettedPerimeter (m)'] = input_src_base['BedArea (m2)']/input_src_base['LENGTHKM']/1000
 input_src_base['WetArea (m2)'] = input_src_base['Volume (m3)']/input_src_base['LENGTHKM']/1000
@@ -83,33 +86,16 @@ output_crosswalk = output_crosswalk.drop_duplicates(ignore_index=True)
 # make hydroTable
 output_hydro_table = output_src.loc[:,['HydroID','feature_id','Stage','Discharge (m3s-1)']]
 output_hydro_table.rename(columns={'Stage' : 'stage','Discharge (m3s-1)':'discharge_cms'},inplace=True)
-if output_hydro_table.HydroID.dtype != 'str': output_hydro_table.HydroID = output_hydro_table.HydroID.astype(str)
-output_hydro_table['HydroID'] = output_hydro_table.HydroID.str.zfill(8)
-output_hydro_table['fossid'] = output_hydro_table.loc[:,'HydroID'].apply(lambda x : str(x)[0:4])
+output_hydro_table['fossid'] = (output_hydro_table['HydroID'] // 10000).astype(str).str.zfill(4)
 if input_huc.fossid.dtype != 'str': input_huc.fossid = input_huc.fossid.astype(str)
 
 output_hydro_table = output_hydro_table.merge(input_huc.loc[:,['fossid','HUC8']],how='left',on='fossid')
-if output_hydro_table.HydroID.dtype != 'int': output_hydro_table.HydroID = output_hydro_table.HydroID.astype(int)
 output_hydro_table = output_hydro_table.merge(input_flows.loc[:,['HydroID','LakeID']],how='left',on='HydroID')
 output_hydro_table['LakeID'] = output_hydro_table['LakeID'].astype(int)
 output_hydro_table = output_hydro_table.rename(columns={'HUC8':'HUC'})
 output_hydro_table.drop(columns='fossid',inplace=True)
 #output_hydro_table['discharge_cms'] = output_hydro_table['discharge_cms'].round(4)
 
-# make src json
-output_src_json = dict()
-hydroID_list = unique(output_src['HydroID'])
-
-for hid in hydroID_list:
-    indices_of_hid = output_src['HydroID'] == hid
-    stage_list = output_src['Stage'][indices_of_hid].astype(float)
-    q_list = output_src['Discharge (m3s-1)'][indices_of_hid].astype(float)
-
-    stage_list = stage_list.tolist()
-    q_list = q_list.tolist()
-
-    output_src_json[str(hid)] = { 'q_list' : q_list , 'stage_list' : stage_list }
-
 # write out
 output_catchments.to_file(output_catchments_fileName, driver="GPKG",index=False)
 output_flows.to_file(output_flows_fileName, driver="GPKG", index=False)
@@ -117,5 +103,9 @@ output_src.to_csv(output_src_fileName,index=False)
 output_crosswalk.to_csv(output_crosswalk_fileName,index=False)
 output_hydro_table.to_csv(output_hydro_table_fileName,index=False)
 
-with open(output_src_json_fileName,'w') as f:
-    json.dump(output_src_json,f,sort_keys=True,indent=2)
+# typed tables with fixed schemas
+write_typed_table(output_src,splitext(output_src_fileName)[0] + '.parquet',SRC_TABLE_DTYPES)
+write_typed_table(output_crosswalk,splitext(output_crosswalk_fileName)[0] + '.parquet',CROSSWALK_TABLE_DTYPES)
+write_typed_table(output_hydro_table,splitext(output_hydro_table_fileName)[0] + '.parquet',HYDRO_TABLE_DTYPES)
+
+write_src_json(output_src,output_src_json_fileName)
@@ -29,5 +29,11 @@ for f in $(find $outputRunDataDir -type f -name hydroTable.csv); do
     ((i=i+1)) #counter variable
 done
 
+# aggregate typed hydro-table
+hydroTables=$(find $outputRunDataDir -type f -name hydroTable.parquet -not -path "$fimAggregateOutputsDir/*")
+if [ -n "$hydroTables" ]; then
+    python3 /foss_fim/lib/aggregate_typed_tables.py -i $hydroTables -o $fimAggregateOutputsDir/hydroTable.parquet
+fi
+
 # cd back
 cd $OLDPWD
@@ -1,47 +1,119 @@
 #!/usr/bin/env·python3
 
 import os
+import sys
+import fiona
 import geopandas as gpd
 import pandas as pd
 from os.path import splitext
+from multiprocessing import Pool
+from osgeo import ogr
+from shapely.geometry import LineString, MultiLineString
 from utils.shared_variables import PREP_PROJECTION
 from derive_headwaters import findHeadWaterPoints
+from vector_partitions import partition_vector_layers
 
 in_dir ='data/inputs/nhdplus_vectors'
 nhd_dir ='data/inputs/nhdplus_vectors_aggregate'
 nwm_dir = 'data/inputs/nwm_hydrofabric'
+wbd_dir = 'data/inputs/wbd'
+partitions_dir = 'data/inputs/huc4_vector_partitions'
 
-## NWM Headwaters
-print ('deriving NWM headwater points')
-nwm_streams = gpd.read_file(os.path.join(nwm_dir,'nwm_flows.gpkg'))
-nwm_headwaters = findHeadWaterPoints(nwm_streams)
-nwm_headwaters.to_file(os.path.join(nwm_dir,'nwm_headwaters.gpkg'),driver='GPKG',index=False)
-
-## NHDPlus HR
-print ('aggregating NHDPlus HR burnline layers')
-nhd_streams_wVAA_fileName_pre=os.path.join(nhd_dir,'NHDPlusBurnLineEvent_wVAA.gpkg')
-
-schema = {'geometry': 'MultiLineString','properties': {'NHDPlusID': 'str','ReachCode': 'str',
-                                                  'FromNode': 'str','ToNode': 'str',
-                                                  'StreamOrde': 'str','DnLevelPat': 'str',
-                                                  'LevelPathI': 'str'}}
-                                                  
-for huc in os.listdir(in_dir):
-    if not huc[0]=='#':
-        burnline_filename = os.path.join(in_dir,huc,'NHDPlusBurnLineEvent' + str(huc) + '.gpkg')
-        vaa_filename = os.path.join(in_dir,huc,'NHDPlusFlowLineVAA' + str(huc) + '.gpkg')
-        if os.path.exists(os.path.join(in_dir,huc,'NHDPlusBurnLineEvent' + str(huc) + '.gpkg')):
-            burnline = gpd.read_file(burnline_filename)
-            nhd_streams_vaa = gpd.read_file(vaa_filename)
-            burnline = burnline[['NHDPlusID','ReachCode','geometry']]
-            nhd_streams_vaa = nhd_streams_vaa[['FromNode','ToNode','NHDPlusID','StreamOrde','DnLevelPat','LevelPathI']]
-            nhd_streams_withVAA = burnline.merge(nhd_streams_vaa,on='NHDPlusID',how='inner')
-            nhd_streams = nhd_streams_withVAA.to_crs(PREP_PROJECTION)
-            if os.path.isfile(nhd_streams_wVAA_fileName_pre):
-                nhd_streams.to_file(nhd_streams_wVAA_fileName_pre,driver='GPKG',index=False, mode='a')
-            else:
-                nhd_streams.to_file(nhd_streams_wVAA_fileName_pre,driver='GPKG',index=False)
+"""
+USAGE:
+./aggregate_nhd_hr_streams.py [number of HUC4s converted at once, default 1]
+
+"""
+
+def convert_huc4_streams(huc):
+
+    """
+        Reads the BurnLineEvent and VAA layers of a HUC4, merges them and reprojects. LineStrings are written as MultiLineStrings.
+        Returns None if the HUC4 has no data.
+    """
+
+    burnline_filename = os.path.join(in_dir,huc,'NHDPlusBurnLineEvent' + str(huc) + '.gpkg')
+    vaa_filename = os.path.join(in_dir,huc,'NHDPlusFlowLineVAA' + str(huc) + '.gpkg')
+
+    if not os.path.exists(burnline_filename):
+        return(None)
+
+    burnline = gpd.read_file(burnline_filename)
+    nhd_streams_vaa = gpd.read_file(vaa_filename)
+    burnline = burnline[['NHDPlusID','ReachCode','geometry']]
+    nhd_streams_vaa = nhd_streams_vaa[['FromNode','ToNode','NHDPlusID','StreamOrde','DnLevelPat','LevelPathI']]
+    nhd_streams_withVAA = burnline.merge(nhd_streams_vaa,on='NHDPlusID',how='inner')
+    nhd_streams = nhd_streams_withVAA.to_crs(PREP_PROJECTION)
+    nhd_streams['geometry'] = [MultiLineString([geom]) if isinstance(geom,LineString) else geom for geom in nhd_streams.geometry]
+
+    return(nhd_streams)
+
+
+if __name__ == '__main__':
+
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+
+    ## NWM Headwaters
+    print ('deriving NWM headwater points')
+    nwm_streams = gpd.read_file(os.path.join(nwm_dir,'nwm_flows.gpkg'))
+    nwm_headwaters = findHeadWaterPoints(nwm_streams)
+    nwm_headwaters.to_file(os.path.join(nwm_dir,'nwm_headwaters.gpkg'),driver='GPKG',index=False)
+
+    ## NHDPlus HR
+    print ('aggregating NHDPlus HR burnline layers')
+    nhd_streams_wVAA_fileName_pre=os.path.join(nhd_dir,'NHDPlusBurnLineEvent_wVAA.gpkg')
+    nhd_streams_wVAA_layerName = splitext(os.path.basename(nhd_streams_wVAA_fileName_pre))[0]
+
+    # fixed schema so every HUC4 is written with the same field types
+    nhd_streams_wVAA_schema = {'geometry': 'MultiLineString','properties': {'NHDPlusID': 'float','ReachCode': 'str',
+                                                                            'FromNode': 'float','ToNode': 'float',
+                                                                            'StreamOrde': 'float','DnLevelPat': 'float',
+                                                                            'LevelPathI': 'float'}}
+
+    if os.path.isfile(nhd_streams_wVAA_fileName_pre):
+        os.remove(nhd_streams_wVAA_fileName_pre)
+
+    hucs = []
+    for huc in os.listdir(in_dir):
+        if not huc[0]=='#':
+            hucs.append(huc)
         else:
-            print ('missing data for huc ' + str(huc))
-    else:
-        print ('skipping huc ' + str(huc))
+            print ('skipping huc ' + str(huc))
+
+    # HUC4s are converted in a pool and appended in order by this process through one open file.
+    # the spatial index is built once all HUC4s are written instead of being updated on every insert
+    nhd_streams_wVAA = None
+    with Pool(num_workers) as pool:
+        for huc, nhd_streams in zip(hucs,pool.imap(convert_huc4_streams,hucs)):
+            if nhd_streams is None:
+                print ('missing data for huc ' + str(huc))
+                continue
+
+            if nhd_streams_wVAA is None:
+                nhd_streams_wVAA = fiona.open(nhd_streams_wVAA_fileName_pre,'w',driver='GPKG',layer=nhd_streams_wVAA_layerName,
+                                              schema=nhd_streams_wVAA_schema,crs_wkt=nhd_streams.crs.to_wkt(),SPATIAL_INDEX='NO')
+
+            nhd_streams_wVAA.writerecords(nhd_streams.iterfeatures())
+
+    if nhd_streams_wVAA is not None:
+        nhd_streams_wVAA.close()
+
+        nhd_streams_wVAA = ogr.Open(nhd_streams_wVAA_fileName_pre,update=1)
+        if nhd_streams_wVAA is None:
+            raise IOError('Unable to open {} to build its spatial index'.format(nhd_streams_wVAA_fileName_pre))
+        result = nhd_streams_wVAA.ExecuteSQL("SELECT CreateSpatialIndex('{}','geom')".format(nhd_streams_wVAA_layerName))
+        created = (result is not None) and (result.GetNextFeature().GetField(0) == 1)
+        if result is not None:
+            nhd_streams_wVAA.ReleaseResultSet(result)
+        nhd_streams_wVAA = None
+        if not created:
+            raise RuntimeError('Unable to build the spatial index of {}'.format(nhd_streams_wVAA_fileName_pre))
+
+    ## HUC4 partitioned store for per HUC subsetting
+    print ('partitioning national vector layers by HUC4')
+    partition_vector_layers({'nwm_flows' : os.path.join(nwm_dir,'nwm_flows.gpkg'),
+                             'nwm_headwaters' : os.path.join(nwm_dir,'nwm_headwaters.gpkg'),
+                             'nwm_catchments' : os.path.join(nwm_dir,'nwm_catchments.gpkg'),
+                             'nwm_lakes' : os.path.join(nwm_dir,'nwm_lakes.gpkg'),
+                             'nhd_burnlines' : nhd_streams_wVAA_fileName_pre},
+                            os.path.join(wbd_dir,'WBD_National.gpkg'),partitions_dir)
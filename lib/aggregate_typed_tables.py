@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+import argparse
+import pyarrow.parquet as pq
+
+
+def aggregate_typed_tables(table_fileNames,output_fileName):
+
+    """
+        Concatenates Parquet tables sharing a schema into one Parquet file, writing one input table at a time
+    """
+
+    writer = None
+    for table_fileName in sorted(table_fileNames):
+        table = pq.read_table(table_fileName)
+        if writer is None:
+            writer = pq.ParquetWriter(output_fileName,table.schema)
+        writer.write_table(table)
+
+    if writer is not None:
+        writer.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Concatenate typed Parquet tables')
+    parser.add_argument('-i','--input-tables',help='Input Parquet tables',required=True,nargs='+')
+    parser.add_argument('-o','--output-table',help='Output Parquet table',required=True)
+
+    args = vars(parser.parse_args())
+
+    aggregate_typed_tables(args['input_tables'],args['output_table'])
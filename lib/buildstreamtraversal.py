@@ -8,6 +8,7 @@ Required Arguments:
 import sys
 import datetime
 import pandas as pd
+import numpy as np
 import argparse
 import geopandas as gpd
 
@@ -78,32 +79,26 @@ class BuildStreamTraversalColumns(object):
 
                 modelstream = modelstream.sort_values(by=[HYDROID], ascending=True).copy()
 
-                xy_dict = {}
-                bhasnullshape=False
-                for rows in modelstream[['geometry', FN_FROMNODE, FN_TONODE]].iterrows():
-                    if rows[1][0]:
-                        # From Node
-                        firstx = round(rows[1][0].coords.xy[0][0], 7)
-                        firsty = round(rows[1][0].coords.xy[1][0], 7)
-                        from_key = '{},{}'.format(firstx, firsty)
-                        if from_key in xy_dict:
-                            modelstream.at[rows[0], FN_FROMNODE,] = xy_dict[from_key]
-                        else:
-                            xy_dict[from_key] = len(xy_dict) + 1
-                            modelstream.at[rows[0], FN_FROMNODE,] = xy_dict[from_key]
-
-                        # To Node
-                        lastx = round(rows[1][0].coords.xy[0][-1], 7)
-                        lasty = round(rows[1][0].coords.xy[1][-1], 7)
-                        to_key = '{},{}'.format(lastx, lasty)
-                        #if xy_dict.has_key(to_key):
-                        if to_key in xy_dict:
-                            modelstream.at[rows[0], FN_TONODE] = xy_dict[to_key]
-                        else:
-                            xy_dict[to_key] = len(xy_dict) + 1
-                            modelstream.at[rows[0], FN_TONODE] = xy_dict[to_key]
-                    else:
-                         bhasnullshape=True
+                # end points of line features, rounded and factorized together. node ids are numbered in the order
+                # points are first met, going through From then To points of each feature
+                has_shape = (modelstream.geometry.notna() & ~modelstream.geometry.is_empty).values
+                bhasnullshape = not has_shape.all()
+
+                end_points = np.array([ (g.coords[0][:2],g.coords[-1][:2]) for g in modelstream.geometry.values[has_shape] ],dtype=np.float64).reshape(-1,2)
+                end_points = np.round(end_points,7)
+
+                _, first_occurrence, node_index = np.unique(end_points, axis=0, return_index=True, return_inverse=True)
+                node_ids = np.empty(len(first_occurrence),dtype=np.int64)
+                node_ids[np.argsort(first_occurrence)] = np.arange(1,len(first_occurrence)+1)
+                node_ids = node_ids[node_index.ravel()].reshape(-1,2)
+
+                # node fields stay object columns so the field type written out does not change
+                from_nodes = modelstream[FN_FROMNODE].values.astype(object)
+                to_nodes = modelstream[FN_TONODE].values.astype(object)
+                from_nodes[has_shape] = node_ids[:,0].tolist()
+                to_nodes[has_shape] = node_ids[:,1].tolist()
+                modelstream[FN_FROMNODE] = pd.Series(from_nodes, index=modelstream.index, dtype=object)
+                modelstream[FN_TONODE] = pd.Series(to_nodes, index=modelstream.index, dtype=object)
 
                 if bhasnullshape==True:
                     print ("Some of the input features have a null shape.")
@@ -115,48 +110,14 @@ class BuildStreamTraversalColumns(object):
             if not FN_NEXTDOWNID in modelstream.columns:
                 modelstream[FN_NEXTDOWNID] = ''
 
-            # Create dict to store FN_FROMNODE values for each HydroID
-            dnodes=dict()
-            lstHydroIDs=[]
-            for row in modelstream[[FN_FROMNODE,HYDROID]].iterrows():
+            # Join To_Node against From_Node. With multiple downstream segments the first one in table order is kept,
+            # segments without a downstream segment are terminal (-1)
+            first_from_nodes = modelstream.drop_duplicates(subset=FN_FROMNODE, keep='first')
+            downstream_positions = pd.Index(first_from_nodes[FN_FROMNODE]).get_indexer(modelstream[FN_TONODE])
+            next_down_ids = np.where(downstream_positions >= 0, first_from_nodes[HYDROID].values[downstream_positions], -1)
 
-                if (row[1][0] in dnodes)==False:
-                    lstHydroIDs=[row[1][1]]
-                    dnodes.setdefault(row[1][0],lstHydroIDs)
-                else:
-                    lstHydroIDs = dnodes[row[1][0]]
-                    lstHydroIDs.append(row[1][1])
-
-            # for each stream segment, search dict for HydroID downstream and
-            for urow in modelstream[[FN_NEXTDOWNID, FN_TONODE, FN_FROMNODE, HYDROID]].iterrows():
-                tonodecol = urow[1][1]
-                nextdownIDcol = urow[1][0]
-                hydroIDcol = urow[1][3]
-                try:
-                    next_down_ids = dnodes[tonodecol]
-                except:
-                    next_down_ids=[]
-                splits = len(next_down_ids)
-                if splits == 0: # terminal segment
-                    nextdownIDcol = -1
-                elif splits == 1:
-                    nextdownIDcol = next_down_ids[0]
-                else: # either muliple inflows or
-                    i = 0
-                    for nid in next_down_ids:
-                        # Set the split code in the NextDownID field.
-                        if split_code < 0: # set terminal NextDownID field to -1; this should never happen..
-                            if i == 0:
-                                nextdownIDcol = split_code
-                        else: # muliple inflows
-                            if i == 0:
-                                nextdownIDcol = nid
-                        i += 1
-                try:
-                    if next_down_ids:del next_down_ids
-                except:
-                    pass
-                modelstream.loc[modelstream[HYDROID]== hydroIDcol,[FN_NEXTDOWNID]] = nextdownIDcol
+            # keep NextDownID an object column so the field type written out does not change
+            modelstream[FN_NEXTDOWNID] = pd.Series(next_down_ids, index=modelstream.index, dtype=object)
 
             tReturns = (sOK, modelstream)
         except Exception:
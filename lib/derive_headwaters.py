@@ -1,32 +1,26 @@
 #!/usr/bin/env·python3
 
 import geopandas as gpd
+import numpy as np
+import argparse
+from os.path import splitext
 from shapely.geometry import Point
+from stream_network_graph import StreamNetworkGraph
 
 
 def findHeadWaterPoints(flows):
 
     flows = flows.explode()
-    headwater_points = []
-    starting_points = set() ; end_points = set()
-    for i,g in enumerate(flows.geometry):
 
-        g_points = [(x,y) for x,y in zip(*g.coords.xy)]
+    # nodes are the exact start and end points of each line. headwater lines have no upstream line
+    end_points = np.array([ (g.coords[0][:2],g.coords[-1][:2]) for g in flows.geometry ],dtype=np.float64).reshape(-1,2)
+    _, node_index = np.unique(end_points, axis=0, return_inverse=True)
+    node_index = node_index.ravel().reshape(-1,2)
 
-        starting_point = g_points[0]
-        end_point = g_points[-1]
+    graph = StreamNetworkGraph.from_nodes(node_index[:,0],node_index[:,1])
 
-        starting_points.add(starting_point)
-        end_points.add(end_point)
+    headwater_points = np.unique(end_points[0::2][graph.headwaters()],axis=0)
 
-        #line_points = np.append(line_points,g_points)
-
-    for i,sp in enumerate(starting_points):
-         #print(sp)
-         if sp not in end_points:
-             headwater_points += [sp]
-
-    #print(headwater_points)
     headwater_points_geometries = [Point(*hwp) for hwp in headwater_points]
     hw_gdf = gpd.GeoDataFrame({'geometry' : headwater_points_geometries},crs=flows.crs,geometry='geometry')
 
@@ -52,5 +46,5 @@ if __name__ == '__main__':
 
     hw_gdf = findHeadWaterPoints(flows)
 
-    if output_headwaters is not None:
+    if args['output_headwaters'] is not None:
         hw_gdf.to_file(args['output_headwaters'],driver=getDriver(args['output_headwaters']))
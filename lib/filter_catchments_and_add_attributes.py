@@ -16,30 +16,19 @@ hucCode = str(sys.argv[6])
 input_catchments = gpd.read_file(input_catchments_fileName)
 wbd = gpd.read_file(wbd_fileName)
 input_flows = gpd.read_file(input_flows_fileName)
-# must drop leading zeroes
-select_flows = tuple(map(str,map(int,wbd[wbd.HUC8.str.contains(hucCode)].fossid)))
+# HydroIDs are fossid followed by a four digit sequence
+select_fossids = wbd[wbd.HUC8.str.contains(hucCode)].fossid.astype(int)
 
-if input_flows.HydroID.dtype != 'str': input_flows.HydroID = input_flows.HydroID.astype(str)
-output_flows = input_flows[input_flows.HydroID.str.startswith(select_flows)].copy()
-if output_flows.HydroID.dtype != 'int': output_flows.HydroID = output_flows.HydroID.astype(int)
+if input_flows.HydroID.dtype != 'int': input_flows.HydroID = input_flows.HydroID.astype(int)
+output_flows = input_flows[(input_flows.HydroID // 10000).isin(select_fossids)].copy()
 
 # merges input flows attributes and filters hydroids
 if input_catchments.HydroID.dtype != 'int': input_catchments.HydroID = input_catchments.HydroID.astype(int)
 output_catchments = input_catchments.merge(output_flows.drop(['geometry'],axis=1),on='HydroID')
 
-# filter out smaller duplicate features
-duplicateFeatures = np.where(np.bincount(output_catchments['HydroID'])>1)[0]
-# print(duplicateFeatures)
-
-for dp in duplicateFeatures:
-    # print(dp)
-    indices_of_duplicate = np.where(output_catchments['HydroID'] == dp)[0]
-    # print(indices_of_duplicate)
-    areas = output_catchments.iloc[indices_of_duplicate,:].geometry.area
-    # print(areas)
-    indices_of_smaller_duplicates = indices_of_duplicate[np.where(areas != np.amax(areas))[0]]
-    # print(indices_of_smaller_duplicates)
-    output_catchments = output_catchments.drop(output_catchments.index[indices_of_smaller_duplicates])
+# filter out smaller duplicate features, keeping every feature with the largest area of its HydroID
+areas = output_catchments.geometry.area
+output_catchments = output_catchments.loc[areas == areas.groupby(output_catchments['HydroID']).transform('max'),:]
 
 # add geometry column
 output_catchments['areasqkm'] = output_catchments.geometry.area/(1000**2)
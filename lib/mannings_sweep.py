@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from os.path import splitext
+from utils.shared_functions import write_typed_table
+from utils.shared_variables import HYDRO_TABLE_DTYPES
+
+
+def mannings_sweep(src_table,stream_orders,mannings_tables):
+
+    """
+        Evaluates SRC discharge for many Manning's n tables at once. Discharge is the hydraulic geometry term
+        WetArea * HydraulicRadius^(2/3) * SLOPE^(1/2) of each SRC row broadcast against an n for every scenario and row.
+
+        Parameters
+        ----------
+        src_table : pandas.DataFrame
+            Crosswalked SRC with HydroID, Stage, WetArea (m2), HydraulicRadius (m) and SLOPE columns.
+        stream_orders : pandas.Series
+            Stream order indexed by HydroID.
+        mannings_tables : dict
+            Scenario name to Manning's n table keyed by stream order, in the format of mannings_template.json.
+
+        Returns
+        -------
+        numpy array
+            Discharge of shape (scenarios, SRC rows) in scenario order of mannings_tables.
+
+    """
+
+    # n lookup of shape (scenarios, stream orders). orders missing from a table get nan like the single table mapping
+    orders = stream_orders.reindex(src_table['HydroID'].values).values
+    max_order = int(max([ int(o) for table in mannings_tables.values() for o in table ] + [0]))
+    n_lookup = np.full((len(mannings_tables),max_order + 1),np.nan)
+    for i,table in enumerate(mannings_tables.values()):
+        for order,n in table.items():
+            n_lookup[i,int(order)] = n
+
+    has_order = ~np.isnan(orders.astype(float))
+    order_index = np.zeros(len(orders),dtype=np.int64)
+    order_index[has_order] = orders[has_order].astype(np.int64)
+    has_order &= (order_index >= 0) & (order_index <= max_order)
+    order_index[~has_order] = 0
+    n_values = n_lookup[:,order_index]
+    n_values[:,~has_order] = np.nan
+
+    hydraulic_term = src_table['WetArea (m2)'].values * \
+                     pow(src_table['HydraulicRadius (m)'].values,2.0/3) * \
+                     pow(src_table['SLOPE'].values,0.5)
+
+    discharges = hydraulic_term[np.newaxis,:] / n_values
+    discharges[:,src_table['Stage'].values == 0] = 0
+
+    return(discharges)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Manning's n sweep of the crosswalked SRC. Writes a hydroTable with an n_scenario column")
+    parser.add_argument('-s','--src',help='Crosswalked SRC table (parquet or csv)',required=True)
+    parser.add_argument('-f','--flows',help='Crosswalked flows with HydroID and order_',required=True)
+    parser.add_argument('-t','--hydro-table',help='hydroTable (parquet or csv)',required=True)
+    parser.add_argument('-n','--mannings-sweep',help="JSON of scenario name to Manning's n table",required=True)
+    parser.add_argument('-o','--output',help='Output hydroTable parquet with n_scenario column',required=True)
+
+    args = vars(parser.parse_args())
+
+    read_table = lambda fileName : pd.read_parquet(fileName) if splitext(fileName)[1] == '.parquet' else pd.read_csv(fileName)
+
+    src_table = read_table(args['src'])
+    hydro_table = read_table(args['hydro_table'])
+    flows = gpd.read_file(args['flows'])
+    stream_orders = flows.drop_duplicates(subset='HydroID').set_index('HydroID')['order_']
+
+    with open(args['mannings_sweep'],'r') as f:
+        mannings_tables = json.load(f)
+
+    if len(src_table) != len(hydro_table):
+        raise ValueError('SRC and hydroTable rows do not match')
+
+    discharges = mannings_sweep(src_table,stream_orders,mannings_tables)
+
+    # rows of hydroTable follow rows of the crosswalked SRC. scenarios are stacked with the SRC rows repeated
+    nscenarios, nrows = discharges.shape
+    sweep_table = hydro_table.loc[:,['HydroID','feature_id','stage','HUC','LakeID']].iloc[np.tile(np.arange(nrows),nscenarios)].reset_index(drop=True)
+    sweep_table['n_scenario'] = pd.Categorical(np.repeat(list(mannings_tables.keys()),nrows),categories=list(mannings_tables.keys()))
+    sweep_table['discharge_cms'] = discharges.ravel()
+
+    write_typed_table(sweep_table,args['output'],dict(HYDRO_TABLE_DTYPES,n_scenario='category'))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import rasterio
+from rasterio.windows import Window
+from rasterio.features import shapes
+from rasterio.transform import Affine
+import geopandas as gpd
+import numpy as np
+import argparse
+from multiprocessing import Pool
+from collections import defaultdict
+from os.path import isfile
+from os import remove
+from shapely.geometry import shape, MultiPolygon
+from shapely.ops import unary_union
+from shapely.affinity import affine_transform
+from shapely import wkb
+
+
+def polygonize_catchments(raster_fileName,vector_fileName,layer_name='catchments',field_name='HydroID',tile_size=1024,num_workers=1):
+    """
+        Polygonizes a catchment raster in parallel tiles and dissolves fragments to one multipolygon per value
+
+        Parameters
+        ----------
+        raster_fileName : str
+            File name of catchment raster (ie gw_catchments_reaches.tif).
+        vector_fileName : str
+            File name of output GeoPackage.
+        layer_name : str
+            Output layer name.
+        field_name : str
+            Output field name holding the raster values.
+        tile_size : int
+            Width and height of tiles in pixels.
+        num_workers : int
+            Number of processes to polygonize and dissolve with.
+
+    """
+
+    with rasterio.open(raster_fileName) as src:
+        nrows, ncols = src.height, src.width
+        transform = src.transform
+        crs = src.crs
+
+    # tiles are polygonized in pixel space so that seams share exact integer coordinates
+    tiles = [ (raster_fileName,Window(col_off,row_off,min(tile_size,ncols-col_off),min(tile_size,nrows-row_off)))
+              for row_off in range(0,nrows,tile_size) for col_off in range(0,ncols,tile_size) ]
+
+    print("Polygonizing {} tiles".format(len(tiles)),flush=True)
+    fragments = defaultdict(list)
+    with Pool(num_workers) as pool:
+        for tile_values,tile_geometries in pool.imap(polygonize_tile,tiles):
+            for value,geometry in zip(tile_values,tile_geometries):
+                fragments[value].append(geometry)
+
+    print("Dissolving fragments for {} catchments".format(len(fragments)),flush=True)
+    values = sorted(fragments.keys())
+    with Pool(num_workers) as pool:
+        geometries = pool.map(dissolve_fragments,[fragments[v] for v in values])
+    del fragments
+
+    # pixel space to map coordinates
+    affine_parameters = [transform.a, transform.b, transform.d, transform.e, transform.c, transform.f]
+    geometries = [affine_transform(wkb.loads(g),affine_parameters) for g in geometries]
+
+    catchments = gpd.GeoDataFrame({field_name : np.array(values,dtype=np.int64), 'geometry' : geometries},crs=crs,geometry='geometry')
+
+    if isfile(vector_fileName):
+        remove(vector_fileName)
+    catchments.to_file(vector_fileName,driver='GPKG',layer=layer_name,index=False)
+
+
+def polygonize_tile(args):
+    """ Polygonizes one tile in pixel coordinates. Returns values and WKB polygons. """
+
+    raster_fileName, window = args
+
+    with rasterio.open(raster_fileName) as src:
+        array = src.read(1,window=window)
+        mask = src.read_masks(1,window=window) > 0
+
+    tile_transform = Affine.translation(window.col_off,window.row_off)
+
+    values, geometries = [], []
+    for geometry,value in shapes(array,mask=mask,connectivity=8,transform=tile_transform):
+        values.append(int(value))
+        geometries.append(shape(geometry).wkb)
+
+    return(values,geometries)
+
+
+def dissolve_fragments(fragments):
+    """ Unions polygon fragments of a single value across tile seams. Returns WKB multipolygon. """
+
+    dissolved = unary_union([wkb.loads(f) for f in fragments])
+
+    if dissolved.geom_type == 'Polygon':
+        dissolved = MultiPolygon([dissolved])
+
+    return(dissolved.wkb)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Polygonize catchment raster in parallel tiles with one multipolygon per catchment')
+    parser.add_argument('-r','--raster',help='Catchment raster',required=True)
+    parser.add_argument('-o','--output',help='Output GeoPackage',required=True)
+    parser.add_argument('-l','--layer',help='Output layer name',required=False,default='catchments')
+    parser.add_argument('-f','--field',help='Output field name',required=False,default='HydroID')
+    parser.add_argument('-t','--tile-size',help='Tile size in pixels',required=False,default=1024,type=int)
+    parser.add_argument('-j','--num-workers',help='Number of workers',required=False,default=1,type=int)
+
+    args = vars(parser.parse_args())
+
+    polygonize_catchments(args['raster'],args['output'],args['layer'],args['field'],args['tile_size'],args['num_workers'])
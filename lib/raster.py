@@ -3,10 +3,9 @@
 
 from osgeo import gdal, ogr, osr
 import numpy as np
-from os.path import isfile
-from os import remove
-from copy import deepcopy
-from subprocess import call
+from os.path import isfile, abspath
+from copy import copy
+from uuid import uuid4
 
 class Raster:
 
@@ -18,7 +17,7 @@ class Raster:
 	Attributes
 	----------
 	array : numpy array
-		raster data in numpy array
+		raster data in numpy array. Read from file on first access
 	gt : list
 		geotransform. see gdal docs for more info.
 	proj : str
@@ -39,15 +38,23 @@ class Raster:
 		number of rows
 	ncols : int
 		number of columns
+	blockSize : tuple
+		natural block size of the file as (columns, rows)
 
 	Methods
 	-------
 	writeRaster(fileName,dtype=None,driverName='GTiff',verbose=False)
 		Write out raster file as geotiff
 	copy()
-		Copy method. Uses deepcopy since array data is present
-	clipToVector(raster_fileName,vector_fileName,verbose=False,output_fileType='GTiff',output_fileName=None,loadOutput=True)
-		Clips to vector using gdalwarp command line utility
+		Copy method. Copies the array only if it has been read
+	read_window(xoff,yoff,xsize,ysize)
+		Reads a window of the raster
+	iter_blocks(blockSize=None)
+		Iterates over the raster in blocks
+	sampleFromCoordinatesArray(x,y,returns='value')
+		Samples raster values from arrays of coordinates
+	clipToVector(raster_fileName,vector_fileName,output_fileName=None,output_fileType='GTiff',verbose=False)
+		Clips to vector in process with gdal.Warp
 
 	Raises
 	------
@@ -103,10 +110,10 @@ class Raster:
 										  8 : np.complex64 , 9 : np.complex64 , 10 : np.complex64 , 11 : np.complex128 }
 
 
-	def __init__(self,fileName,loadArray=True,dtype=None):
+	def __init__(self,fileName,loadArray=False,dtype=None,memmap=False):
 
 		"""
-		Initializes Raster Instance from single band raster
+		Initializes Raster Instance from single band raster. Only metadata is read, the array is read on first access
 
 		...
 
@@ -114,8 +121,12 @@ class Raster:
 		----------
 		fileName : str
 			File path to single band raster
+		loadArray : Boolean, optional
+			Read the array on initialization instead of on first access (Default Value = False)
 		dtype : numpy datatype or int, optional
 			Numpy, GDT, or integer code data type used to override the data type on the file when imported to array (Default Value = None, None sets to the numpy array data type to the one in the raster file)
+		memmap : Boolean, optional
+			Back the array with a read only memory map of the file when the format allows it, otherwise the array is read (Default Value = False)
 
 		Returns
 		-------
@@ -124,7 +135,8 @@ class Raster:
 
 		"""
 
-		if not isfile(fileName):
+		# gdal virtual file systems such as /vsimem are not visible to os.path
+		if not (isfile(fileName) or (fileName.startswith('/vsi') and (gdal.VSIStatL(fileName) is not None))):
 			raise OSError("File \'{}\' does not exist".format(fileName))
 
 		stream = gdal.Open(fileName,gdal.GA_ReadOnly)
@@ -132,9 +144,6 @@ class Raster:
 		self.nrows,self.ncols = stream.RasterYSize , stream.RasterXSize
 		self.nbands = stream.RasterCount
 
-		if loadArray:
-			self.array = stream.ReadAsArray()
-
 		self.gt = stream.GetGeoTransform()
 		self.proj = stream.GetProjection()
 
@@ -157,24 +166,26 @@ class Raster:
 			# sets array data type
 			if isinstance(dtype,type): # if dtype is a numpy data tpe
 
-				self.array = self.array.astype(dtype)
+				self._arrayType = np.dtype(dtype)
 
 			else: # if dtype is an integer code of GDAL GDT variable
 
 				try:
-					self.array = self.array.astype(self.dataTypeConversion_integer_to_name[dtype])
+					self._arrayType = np.dtype(self.dataTypeConversion_integer_to_name[dtype])
 				except KeyError:
 					raise ValueError('{} dtype parameter not accepted. check docs for valid input or set to None to use data type from raster'.format(dtype))
 
 		else: # sets to default data type in raster file
 
 			self.dt = band.DataType
+			self._arrayType = None
 
-			try:
-				self.array.astype(self.dataTypeConversion_integer_to_name[self.dt])
-			except KeyError:
+			if self.dt not in self.dataTypeConversion_integer_to_name:
 				raise ValueError('{} dtype parameter not accepted. check docs for valid input or set to None to use data type from raster'.format(self.dt))
 
+		# natural block size of the file as (columns, rows)
+		self.blockSize = tuple(band.GetBlockSize())
+
 		try:
 			self.des = band.GetDescription()
 		except AttributeError:
@@ -187,9 +198,16 @@ class Raster:
 
 		# self.dim = self.array.shape
 		self.fileName = fileName
+		self.memmap = memmap
 
 		stream,band = None,None
 
+		self._array = None
+		self._mappedStream = None
+
+		if loadArray:
+			self._array = self._readArray()
+
 
 	@property
 	def dim(self):
@@ -203,9 +221,163 @@ class Raster:
 		return(DIMS)
 
 
+	@property
+	def array(self):
+		""" Property method for raster data. Reads the whole raster on first access """
+
+		if self._array is None:
+			self._array = self._readArray()
+
+		return(self._array)
+
+
+	@array.setter
+	def array(self,array):
+		self._array = array
+
+
+	@property
+	def isLoaded(self):
+		""" Property method for whether the array has been read """
+		return(self._array is not None)
+
+
+	def _readArray(self,xoff=0,yoff=0,xsize=None,ysize=None):
+
+		"""
+		Reads a window of the raster file into a numpy array of the raster's array data type. Whole raster by default
+		"""
+
+		if xsize is None:
+			xsize = self.ncols - xoff
+		if ysize is None:
+			ysize = self.nrows - yoff
+
+		wholeRaster = (xoff,yoff,xsize,ysize) == (0,0,self.ncols,self.nrows)
+
+		stream = gdal.Open(self.fileName,gdal.GA_ReadOnly)
+		source = stream if self.nbands > 1 else stream.GetRasterBand(1)
+
+		# memory map raw formats. the mapping is only valid while the dataset stays open
+		if self.memmap & wholeRaster & (self.nbands == 1):
+			try:
+				array = source.GetVirtualMemAutoArray(gdal.GF_Read)
+			except (RuntimeError,AttributeError):
+				array = None
+
+			if array is not None:
+				self._mappedStream = stream,source
+				if self._arrayType is None:
+					return(array)
+				return(array.astype(self._arrayType,copy=False))
+
+		if self._arrayType is None:
+			array = source.ReadAsArray(xoff,yoff,xsize,ysize)
+		else:
+			# gdal converts into the buffer as it reads so the data is not copied a second time
+			shape = (ysize,xsize) if self.nbands == 1 else (self.nbands,ysize,xsize)
+			array = np.empty(shape,dtype=self._arrayType)
+			try:
+				source.ReadAsArray(xoff,yoff,xsize,ysize,buf_obj=array)
+			except (ValueError,TypeError): # numpy type without a GDAL equivalent
+				array = source.ReadAsArray(xoff,yoff,xsize,ysize).astype(self._arrayType,copy=False)
+
+		stream,source = None,None
+
+		return(array)
+
+
+	def read_window(self,xoff,yoff,xsize,ysize):
+
+		"""
+		Reads a window of the raster
+
+		...
+
+		Parameters
+		----------
+		xoff : int
+			Column index of the upper left cell of the window
+		yoff : int
+			Row index of the upper left cell of the window
+		xsize : int
+			Number of columns in the window
+		ysize : int
+			Number of rows in the window
+
+		Returns
+		-------
+		numpy array
+			Window of shape (ysize, xsize) for single band and (bands, ysize, xsize) for multi-band rasters. A view of the array if it has been read
+
+		Raises
+		------
+		ValueError
+			If the window does not lie within the raster
+
+		"""
+
+		if (xoff < 0) | (yoff < 0) | (xsize < 1) | (ysize < 1) | (xoff + xsize > self.ncols) | (yoff + ysize > self.nrows):
+			raise ValueError("Window ({},{},{},{}) not in raster range ({},{})".format(xoff,yoff,xsize,ysize,self.nrows,self.ncols))
+
+		if self.isLoaded:
+			return(self._array[...,yoff:yoff + ysize,xoff:xoff + xsize])
+
+		return(self._readArray(xoff,yoff,xsize,ysize))
+
+
+	def iter_blocks(self,blockSize=None):
+
+		"""
+		Iterates over the raster in blocks in row major order
+
+		...
+
+		Parameters
+		----------
+		blockSize : tuple, optional
+			Block size as (columns, rows) (Default Value = self.blockSize, the natural block size of the file)
+
+		Yields
+		------
+		tuple
+			Window as (xoff, yoff, xsize, ysize) and the window array. Edge blocks are truncated to the raster
+
+		Examples
+		--------
+		Count data cells without reading the whole raster
+		>>> rasterData = fldpln.Raster('path/to/raster')
+		>>> sum([ (block != rasterData.ndv).sum() for window,block in rasterData.iter_blocks() ])
+
+		"""
+
+		if blockSize is None:
+			blockSize = self.blockSize
+
+		block_xsize, block_ysize = blockSize
+
+		for yoff in range(0,self.nrows,block_ysize):
+			ysize = min(block_ysize,self.nrows - yoff)
+			for xoff in range(0,self.ncols,block_xsize):
+				xsize = min(block_xsize,self.ncols - xoff)
+				yield((xoff,yoff,xsize,ysize),self.read_window(xoff,yoff,xsize,ysize))
+
+
 	def copy(self):
-		""" Copy method. Uses deepcopy since array data is present """
-		return(deepcopy(self))
+		""" Copy method. Copies the array only if it has been read """
+
+		raster = copy(self)
+
+		if self.isLoaded:
+			raster._array = self._array.copy()
+			raster._mappedStream = None
+
+		try:
+			raster.ct = self.ct.Clone()
+		except AttributeError:
+			pass
+
+		return(raster)
 
 
 	def writeRaster(self,fileName,dtype=None,driverName='GTiff',verbose=False):
@@ -241,6 +413,11 @@ class Raster:
 
 		"""
 
+		# read before the file is created since fileName may be the raster's own file
+		array = self.array
+		if (self._mappedStream is not None) and (abspath(fileName) == abspath(self.fileName)):
+			array = np.array(array)
+
 		driver = gdal.GetDriverByName(driverName)
 
 		if dtype is None:
@@ -249,14 +426,14 @@ class Raster:
 			except AttributeError:
 				# dtype = gdal.GDT_Float64
 				try:
-					dtype = self.dataTypeConversion_name_to_integer[self.array.dtype]
+					dtype = self.dataTypeConversion_name_to_integer[array.dtype]
 				except KeyError:
-					raise ValueError('{} dtype parameter not accepted. check docs for valid input or set to None to use data type from numpy array'.format(self.array.dtype))
+					raise ValueError('{} dtype parameter not accepted. check docs for valid input or set to None to use data type from numpy array'.format(array.dtype))
 		else:
 			try:
 				dtype = self.dataTypeConversion_name_to_integer[dtype]
 			except KeyError:
-				raise ValueError('{} dtype parameter not accepted. check docs for valid input or set to None to use data type from numpy array'.format(self.array.dtype))
+				raise ValueError('{} dtype parameter not accepted. check docs for valid input or set to None to use data type from numpy array'.format(array.dtype))
 
 		dataset = driver.Create(fileName, self.ncols, self.nrows, 1, dtype)
 		dataset.SetGeoTransform(self.gt)
@@ -277,7 +454,7 @@ class Raster:
 			pass
 
 		band.SetNoDataValue(self.ndv)
-		band.WriteArray(self.array)
+		band.WriteArray(array)
 		band, dataset = None,None  # Close the file
 
 		if verbose:
@@ -317,7 +494,7 @@ class Raster:
 	@classmethod
 	def clipToVector(cls,raster_fileName,vector_fileName,output_fileName=None,output_fileType='GTiff',verbose=False):
 		"""
-		Clips to vector using gdalwarp command line utility
+		Clips to vector in process with gdal.Warp
 
 		...
 
@@ -328,7 +505,7 @@ class Raster:
 		vector_fileName : str
 			File path to vector layer to clip with
 		output_fileName : str
-			Set file path to output clipped raster (Default Value = None)
+			Set file path to output clipped raster. May be a /vsimem path. (Default Value = None, None clips to a private in memory file that is released once the array is read)
 		output_fileType : str
 			Set file type of output from GDAL drivers list (Default Value = 'GTiff')
 		verbose : Boolean
@@ -337,11 +514,12 @@ class Raster:
 		Returns
 		-------
 		raster : raster
-			Clipped raster layer
+			Clipped raster layer. Array is read when output_fileName is None, otherwise it is read on first access
 
-		Notes
-		-----
-		gdalwarp utility must be installed and callable via a subprocess
+		Raises
+		------
+		OSError
+			If gdal.Warp fails
 
 		Examples
 		--------
@@ -353,32 +531,48 @@ class Raster:
 
 		"""
 
-		# create temp output if none is desired
-		if output_fileName is None:
-			output_fileName = 'temp.tif'
+		# unique in memory output so concurrent clips do not share a file
+		inMemory = output_fileName is None
+		if inMemory:
+			output_fileName = '/vsimem/clipToVector_{}.tif'.format(uuid4().hex)
+			output_fileType = 'GTiff'
 
-		# generate command
-		command = ['gdalwarp','-overwrite','-of',output_fileType,'-cutline',vector_fileName,'-crop_to_cutline',raster_fileName,output_fileName]
+		if verbose:
+			prog_func = gdal.TermProgress_nocb
+		else:
+			prog_func = None
 
-		# insert quiet flag if not verbose
-		if not verbose:
-			command = command.insert(1,'-q')
+		dataset = gdal.Warp(output_fileName,raster_fileName,format=output_fileType,cutlineDSName=vector_fileName,cropToCutline=True,callback=prog_func)
 
-		# call command
-		call(command)
+		if dataset is None:
+			raise OSError("Clipping \'{}\' to \'{}\' failed".format(raster_fileName,vector_fileName))
 
-		# remove temp file
-		if output_fileName is None:
-			remove(output_fileName)
+		# flush to output
+		dataset = None
 
-		return(cls(output_fileName))
+		if not inMemory:
+			return(cls(output_fileName))
+
+		# read the clipped array and release the in memory file
+		try:
+			clippedRaster = cls(output_fileName,loadArray=True)
+		finally:
+			gdal.Unlink(output_fileName)
+
+		return(clippedRaster)
 
 	def getCoordinatesFromIndex(self,row,col):
 		"""
-		Returns coordinates in the rasters projection from a given multi-index
+		Returns coordinates in the rasters projection from a given multi-index. row and col may be scalars or arrays
 
 		"""
 
+		# array-likes are broadcast
+		if not np.isscalar(row):
+			row = np.asarray(row)
+		if not np.isscalar(col):
+			col = np.asarray(col)
+
 		# extract variables for readability
 		x_upper_limit, y_upper_limit = self.gt[0], self.gt[3]
 		x_resolution, y_resolution = self.gt[1], self.gt[5]
@@ -390,6 +584,73 @@ class Raster:
 		return(x,y)
 
 
+	def _indicesFromCoordinates(self,x,y):
+		""" Row and column indices from coordinate arrays. Indices are not checked against the raster limits """
+
+		# extract variables for readability
+		x_upper_limit, y_upper_limit = self.gt[0], self.gt[3]
+		x_resolution, y_resolution = self.gt[1], self.gt[5]
+
+		# get upper left hand corner coordinates from the centroid coordinates of the upper left pixel
+		x_upper_limit =  x_upper_limit - (x_resolution/2)
+		y_upper_limit = y_upper_limit - (y_resolution/2)
+
+		# truncate towards zero like int()
+		columnIndices = np.trunc( ( np.asarray(x,dtype=np.float64) - x_upper_limit) / x_resolution).astype(np.int64)
+		rowIndices = np.trunc( ( np.asarray(y,dtype=np.float64) - y_upper_limit) / y_resolution).astype(np.int64)
+
+		return(rowIndices,columnIndices)
+
+
+	def _isNoData(self,values):
+		""" Boolean mask of no data values. A NaN no data value matches NaN values """
+
+		values = np.asarray(values)
+
+		if self.ndv is None:
+			return(np.zeros(values.shape,dtype=bool))
+		if np.isnan(self.ndv):
+			return(np.isnan(values) if values.dtype.kind in 'fc' else np.zeros(values.shape,dtype=bool))
+
+		return(values == self.ndv)
+
+
+	def _sampleFromIndices(self,rowIndices,columnIndices):
+		""" Values at in range indices. Reads only the blocks holding samples, one block at a time, if the array has not been read """
+
+		if self.isLoaded:
+			return(self._array[rowIndices,columnIndices])
+
+		block_xsize, block_ysize = self.blockSize
+		nblockcols = -(-self.ncols // block_xsize)
+
+		# group samples by block
+		blocks = (rowIndices // block_ysize) * nblockcols + (columnIndices // block_xsize)
+		order = np.argsort(blocks,kind='stable')
+		uniqueBlocks, starts = np.unique(blocks[order],return_index=True)
+		ends = np.append(starts[1:],len(order))
+
+		if self._arrayType is not None:
+			values = np.empty(len(rowIndices),dtype=self._arrayType)
+		else:
+			values = None
+
+		for block,start,end in zip(uniqueBlocks,starts,ends):
+			yoff, xoff = (block // nblockcols) * block_ysize, (block % nblockcols) * block_xsize
+			window = self.read_window(xoff,yoff,min(block_xsize,self.ncols - xoff),min(block_ysize,self.nrows - yoff))
+
+			if values is None:
+				values = np.empty(len(rowIndices),dtype=window.dtype)
+
+			samples = order[start:end]
+			values[samples] = window[rowIndices[samples] - yoff,columnIndices[samples] - xoff]
+
+		if values is None: # no samples
+			values = np.empty(0,dtype=self.dataTypeConversion_integer_to_name[self.dt])
+
+		return(values)
+
+
 	def sampleFromCoordinates(self,x,y,returns='value'):
 		"""
 		Sample raster value from coordinates
@@ -397,48 +658,33 @@ class Raster:
 
 		Parameters
 		----------
-		raster_fileName : str
-			File path to raster to clip
-		vector_fileName : str
-			File path to vector layer to clip with
-		output_fileName : str
-			Set file path to output clipped raster (Default Value = None)
-		output_fileType : str
-			Set file type of output from GDAL drivers list (Default Value = 'GTiff')
-		verbose : Boolean
-			Verbose output (Default Value = False)
+		x : number
+			X coordinate in the rasters projection
+		y : number
+			Y coordinate in the rasters projection
+		returns : str
+			One of 'value', 'multi-index' or 'ravel-index' (Default Value = 'value')
 
 		Returns
 		-------
-		raster : raster
-			Clipped raster layer
+		number or tuple
+			Raster value, (row, column) index or ravelled index of the sampled cell
 
-		Notes
-		-----
-		gdalwarp utility must be installed and callable via a subprocess
+		Raises
+		------
+		ValueError
+			If the coordinates are not in the raster or the sample value is no data
 
-		Examples
+		See Also
 		--------
-		clip raster and don't return
-		>>> fldpln.raster.clipToVector('path/to/raster','path/to/clipping/vector','path/to/write/output/raster/to')
-		Clip raster and return but don't write
-		>>> clippedRaster = fldpln.raster.clipToVector('path/to/raster','path/to/clipping/vector')
-
+		sampleFromCoordinatesArray : samples arrays of coordinates
 
 		"""
 
-		# extract variables for readability
-		x_upper_limit, y_upper_limit = self.gt[0], self.gt[3]
-		x_resolution, y_resolution = self.gt[1], self.gt[5]
 		nrows, ncols = self.nrows, self.ncols
 
-		# get upper left hand corner coordinates from the centroid coordinates of the upper left pixel
-		x_upper_limit =  x_upper_limit - (x_resolution/2)
-		y_upper_limit = y_upper_limit - (y_resolution/2)
-
 		# get indices
-		columnIndex = int( ( x - x_upper_limit) / x_resolution)
-		rowIndex = int( ( y - y_upper_limit) / y_resolution)
+		rowIndex, columnIndex = [ int(i) for i in self._indicesFromCoordinates(x,y) ]
 
 		# check indices lie within raster limits
 		columnIndexInRange = ncols > columnIndex >= 0
@@ -447,16 +693,84 @@ class Raster:
 		if (not columnIndexInRange) | (not rowIndexInRange):
 			raise ValueError("Row Index {} or column index {} not in raster range ({},{})".format(rowIndex,columnIndex,nrows,ncols))
 
+		value = self._sampleFromIndices(np.array([rowIndex]),np.array([columnIndex]))[0]
+
 		# check value is not ndv
-		if self.array[rowIndex,columnIndex] == self.ndv:
+		if self._isNoData(value):
 			raise ValueError("Sample value is no data at ({},{})".format(nrows,ncols))
 
 		# return if statements
 		if returns == 'value':
-			return(self.array[rowIndex,columnIndex])
+			return(value)
 		elif returns == 'multi-index':
 			return(rowIndex,columnIndex)
 		elif returns == 'ravel-index':
 			return(np.ravel_multi_index((rowIndex,columnIndex),(nrows,ncols)))
 		else:
 			raise ValueError('Enter valid returns argument')
+
+
+	def sampleFromCoordinatesArray(self,x,y,returns='value'):
+		"""
+		Sample raster values from arrays of coordinates
+		...
+
+		Parameters
+		----------
+		x : array-like
+			X coordinates in the rasters projection
+		y : array-like
+			Y coordinates in the rasters projection
+		returns : str
+			One of 'value', 'multi-index' or 'ravel-index' (Default Value = 'value')
+
+		Returns
+		-------
+		result : numpy array or tuple
+			Raster values, (row indices, column indices) or ravelled indices of the sampled cells. Values are 0 and indices are -1 for coordinates outside the raster
+		nodata : numpy array
+			Boolean mask of coordinates outside the raster or on no data cells
+
+		Raises
+		------
+		ValueError
+			If returns is not valid or the raster has more than one band
+
+		Notes
+		-----
+		If the array has not been read only the blocks holding samples are read
+
+		Examples
+		--------
+		Sample values at points
+		>>> rasterData = fldpln.Raster('path/to/raster')
+		>>> values, nodata = rasterData.sampleFromCoordinatesArray(points.geometry.x,points.geometry.y)
+
+		"""
+
+		if returns not in ('value','multi-index','ravel-index'):
+			raise ValueError('Enter valid returns argument')
+
+		if self.nbands > 1:
+			raise ValueError('Batch sampling only accepts single band rasters')
+
+		nrows, ncols = self.nrows, self.ncols
+
+		rowIndices, columnIndices = self._indicesFromCoordinates(x,y)
+		inRange = (rowIndices >= 0) & (rowIndices < nrows) & (columnIndices >= 0) & (columnIndices < ncols)
+
+		values = self._sampleFromIndices(rowIndices[inRange],columnIndices[inRange])
+
+		nodata = ~inRange
+		nodata[inRange] = self._isNoData(values)
+
+		if returns == 'value':
+			result = np.zeros(inRange.shape,dtype=values.dtype)
+			result[inRange] = values
+		elif returns == 'multi-index':
+			result = np.where(inRange,rowIndices,-1),np.where(inRange,columnIndices,-1)
+		else:
+			result = np.full(inRange.shape,-1,dtype=np.int64)
+			result[inRange] = np.ravel_multi_index((rowIndices[inRange],columnIndices[inRange]),(nrows,ncols))
+
+		return(result,nodata)
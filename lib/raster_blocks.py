@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def check_alignment(datasets,strict=True):
+
+    """
+        Checks that rasterio datasets share a grid. Raises ValueError otherwise.
+
+        Parameters
+        ----------
+        datasets : list
+            Open rasterio datasets.
+        strict : bool
+            If False, transform and crs mismatches print a warning instead of raising. Shape mismatches always raise
+            since blocks could not be read from every dataset.
+
+    """
+
+    reference = datasets[0]
+
+    for dataset in datasets[1:]:
+        if (dataset.width,dataset.height) != (reference.width,reference.height):
+            raise ValueError('{} shape {} does not match {} shape {}'.format(dataset.name,dataset.shape,reference.name,reference.shape))
+
+        mismatches = []
+        if not dataset.transform.almost_equals(reference.transform):
+            mismatches.append('{} transform does not match {} transform'.format(dataset.name,reference.name))
+        if dataset.crs != reference.crs:
+            mismatches.append('{} crs does not match {} crs'.format(dataset.name,reference.name))
+
+        for mismatch in mismatches:
+            if strict:
+                raise ValueError(mismatch)
+            print('Warning: {}. Blocks are read by cell position'.format(mismatch),flush=True)
+
+
+def iter_aligned_blocks(datasets,band=1,strict=True):
+
+    """
+        Reads aligned rasters block by block over the block windows of the first raster.
+
+        Parameters
+        ----------
+        datasets : list
+            Open rasterio datasets on the same grid.
+        band : int
+            Band to read from every dataset.
+        strict : bool
+            Raise on transform or crs mismatches instead of warning. See check_alignment.
+
+        Yields
+        ------
+        tuple
+            Window and a tuple of the window arrays in dataset order.
+
+    """
+
+    check_alignment(datasets,strict)
+
+    for ji, window in datasets[0].block_windows(band):
+        yield(window,tuple(dataset.read(band,window=window) for dataset in datasets))
+
+
+def map_blocks(function,datasets,band=1,num_workers=1,max_pending=None,strict=True):
+
+    """
+        Maps a function over the blocks of aligned rasters with a thread pool. Reads happen in the calling thread
+        since dataset handles are not thread safe. numpy and nogil numba functions run concurrently.
+
+        Parameters
+        ----------
+        function : callable
+            Called with one array per dataset and returns the output block.
+        datasets : list
+            Open rasterio datasets on the same grid.
+        band : int
+            Band to read from every dataset.
+        num_workers : int
+            Number of threads. 1 runs in the calling thread.
+        max_pending : int
+            Blocks read ahead of the oldest unfinished block. Bounds memory. Defaults to twice num_workers.
+        strict : bool
+            Raise on transform or crs mismatches instead of warning. See check_alignment.
+
+        Yields
+        ------
+        tuple
+            Window and function output in block order.
+
+    """
+
+    if num_workers <= 1:
+        for window, arrays in iter_aligned_blocks(datasets,band,strict):
+            yield(window,function(*arrays))
+        return
+
+    if max_pending is None:
+        max_pending = 2 * num_workers
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+
+        pending = deque()
+        for window, arrays in iter_aligned_blocks(datasets,band,strict):
+            pending.append((window,executor.submit(function,*arrays)))
+
+            if len(pending) >= max_pending:
+                window, future = pending.popleft()
+                yield(window,future.result())
+
+        while pending:
+            window, future = pending.popleft()
+            yield(window,future.result())
+
+
+def write_blocks(function,datasets,destination,band=1,num_workers=1,max_pending=None,strict=True):
+
+    """
+        Maps a function over the blocks of aligned rasters and writes the outputs in block order.
+
+        Parameters
+        ----------
+        function : callable
+            Called with one array per dataset and returns the output block.
+        datasets : list
+            Open rasterio datasets on the same grid.
+        destination : rasterio dataset
+            Raster open for writing on the same grid.
+        band : int
+            Band to read from every dataset and write to destination.
+        num_workers : int
+            Number of threads.
+        max_pending : int
+            Blocks read ahead of the oldest unfinished block.
+        strict : bool
+            Raise on transform or crs mismatches instead of warning. See check_alignment.
+
+    """
+
+    # inputs are checked by map_blocks
+    check_alignment([datasets[0],destination],strict)
+
+    for window, block in map_blocks(function,datasets,band,num_workers,max_pending,strict):
+        destination.write(block,window=window,indexes=band)
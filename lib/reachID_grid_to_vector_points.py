@@ -1,17 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8
 
-from osgeo import gdal
 import numpy as np
-import osgeo.ogr
-import osgeo.osr
 import sys
-
-import cProfile
-from tqdm import tqdm
-import geopandas as gpd
-from shapely.geometry import Point
-from raster import Raster
+import os
+import rasterio
+import fiona
+from rasterio.windows import Window
 
 """
 USAGE:
@@ -23,63 +18,48 @@ path = sys.argv[1]
 outputFileName = sys.argv[2]
 writeOption = sys.argv[3]
 
-#r = gdal.Open(path)
-#band = r.GetRasterBand(1)
-boolean=Raster(path)
-
-#(upper_left_x, x_size, x_rotation, upper_left_y, y_rotation, y_size) = r.GetGeoTransform()
-(upper_left_x, x_size, x_rotation, upper_left_y, y_rotation, y_size) = boolean.gt
+if writeOption not in ('reachID','featureID','pixelID'):
+    raise ValueError("Write option must be reachID, featureID, or pixelID")
 
-#a = band.ReadAsArray().astype(np.float)
+schema = {'geometry' : 'Point', 'properties' : {'id' : 'int'}}
+min_strip_height = 256
+layerName = os.path.splitext(os.path.basename(outputFileName))[0]
 
-# indices = np.nonzero(a != band.GetNoDataValue())
-indices = np.nonzero(boolean.array >= 1)
+with rasterio.open(path) as src:
 
-# Init the shapefile stuff..
-#srs = osgeo.osr.SpatialReference()
-#srs.ImportFromWkt(r.GetProjection())
+    upper_left_x, x_size, upper_left_y, y_size = src.transform.c, src.transform.a, src.transform.f, src.transform.e
 
-#driver = osgeo.ogr.GetDriverByName('GPKG')
-#shapeData = driver.CreateDataSource(outputFileName)
+    # full width strips keep points in row major order. strips are whole multiples of the block height and at least
+    # min_strip_height rows so 1 row striped rasters are not written one transaction per row
+    block_height = src.block_shapes[0][0]
+    strip_height = block_height * int(np.ceil(min_strip_height / block_height))
 
-#layer = shapeData.CreateLayer('ogr_pts', srs, osgeo.ogr.wkbPoint)
-#layerDefinition = layer.GetLayerDefn()
+    if os.path.isfile(outputFileName):
+        os.remove(outputFileName)
 
-#idField = osgeo.ogr.FieldDefn("id", osgeo.ogr.OFTInteger)
-#layer.CreateField(idField)
+    with fiona.open(outputFileName,'w',driver='GPKG',layer=layerName,schema=schema,crs_wkt=src.crs.to_wkt()) as dst:
 
-id =[None] * len(indices[0]);points = [None]*len(indices[0])
+        numberOfPoints = 0
+        for row_off in range(0,src.height,strip_height):
 
-# Iterate over the Numpy points..
-i = 1
-for y_index,x_index in tqdm(zip(*indices),total=len(indices[0])):
-    x = x_index * x_size + upper_left_x + (x_size / 2) #add half the cell size
-    y = y_index * y_size + upper_left_y + (y_size / 2) #to centre the point
+            window = Window(0,row_off,src.width,min(strip_height,src.height - row_off))
+            strip = src.read(1,window=window)
 
-    # get raster value
-    #reachID = a[y_index,x_index]
+            y_index, x_index = np.nonzero(strip >= 1)
 
-    #point = osgeo.ogr.Geometry(osgeo.ogr.wkbPoint)
-    #point.SetPoint(0, x, y)
-    points[i-1] = Point(x,y)
+            x = x_index * x_size + upper_left_x + (x_size / 2) #add half the cell size
+            y = (y_index + row_off) * y_size + upper_left_y + (y_size / 2) #to centre the point
 
-    #feature = osgeo.ogr.Feature(layerDefinition)
-    #feature.SetGeometry(point)
-    #feature.SetFID(i)
-    if writeOption == 'reachID':
-        reachID = a[y_index,x_index]
-        id[i-1] = reachID
-	#feature.SetField("id",reachID)
-    elif (writeOption == 'featureID') |( writeOption == 'pixelID'):
-        #feature.SetField("id",i)
-        id[i-1] = i
-    #layer.CreateFeature(feature)
+            if writeOption == 'reachID':
+                # id field is an integer field whatever the raster data type
+                ids = strip[y_index,x_index].astype(np.int64)
+            else:
+                ids = np.arange(numberOfPoints + 1,numberOfPoints + len(x_index) + 1)
 
-    i += 1
+            # one transaction per strip. tolist gives python ints for the int field
+            dst.writerecords({'geometry' : {'type' : 'Point', 'coordinates' : (xi,yi)}, 'properties' : {'id' : i}}
+                             for xi,yi,i in zip(x.tolist(),y.tolist(),ids.tolist()))
 
-pointGDF = gpd.GeoDataFrame({'id' : id, 'geometry' : points},crs=boolean.proj,geometry='geometry')
-pointGDF.to_file(outputFileName,driver='GPKG',index=False)
+            numberOfPoints += len(x_index)
 
 print("Complete")
-#shapeData.Destroy()
-
@@ -4,9 +4,10 @@ from numba import njit, typeof, typed, types
 import rasterio
 import numpy as np
 import argparse
+from raster_blocks import iter_aligned_blocks, write_blocks
 
 
-def rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName):
+def rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName, num_workers=1):
     """
         Calculates REM/HAND/Detrended DEM
         
@@ -18,6 +19,8 @@ def rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName):
             File name of stream pixel watersheds raster.
         rem_fileName : str
             File name of output relative elevation raster.
+        num_workers : int
+            Number of threads computing REM blocks.
 
     """
 
@@ -42,16 +45,13 @@ def rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName):
     
     catchmentMinDict = typed.Dict.empty(types.int32,types.float32)
     
-    # get pixel sheds minimum dictionary
-    for ji, window in dem_rasterio_object.block_windows(1):
-         dem_window = dem_rasterio_object.read(1,window=window).ravel()
-         catchments_window = pixel_catchments_rasterio_object.read(1,window=window).ravel()
-
-         catchmentMinDict = make_catchment_min_dict(dem_window,catchmentMinDict,catchments_window)
+    # get pixel sheds minimum dictionary. grids that do not match only warn, rasters are read by cell position as before
+    for window, (dem_window, catchments_window) in iter_aligned_blocks([dem_rasterio_object,pixel_catchments_rasterio_object],strict=False):
+         catchmentMinDict = make_catchment_min_dict(dem_window.ravel(),catchmentMinDict,catchments_window.ravel())
          
     # create rem_fileName grid 
     
-    @njit
+    @njit(nogil=True)
     def calculate_rem(flat_dem,catchmentMinDict,flat_catchments,ndv):
 
         rem_window = np.zeros(len(flat_dem),dtype=np.float32)
@@ -65,16 +65,11 @@ def rel_dem(dem_fileName, pixel_watersheds_fileName, rem_fileName):
 
     rem_rasterio_object = rasterio.open(rem_fileName,'w',**meta)
     
-    for ji, window in dem_rasterio_object.block_windows(1):
-        dem_window = dem_rasterio_object.read(1,window=window)
-        window_shape = dem_window.shape
-        dem_window = dem_window.ravel()
-        catchments_window = pixel_catchments_rasterio_object.read(1,window=window).ravel()
-        
-        rem_window = calculate_rem(dem_window,catchmentMinDict,catchments_window,meta['nodata'])
-        rem_window = rem_window.reshape(window_shape).astype(np.float32)
-        
-        rem_rasterio_object.write(rem_window, window=window, indexes=1)
+    def rem_block(dem_window,catchments_window):
+        rem_window = calculate_rem(dem_window.ravel(),catchmentMinDict,catchments_window.ravel(),meta['nodata'])
+        return(rem_window.reshape(dem_window.shape).astype(np.float32))
+
+    write_blocks(rem_block,[dem_rasterio_object,pixel_catchments_rasterio_object],rem_rasterio_object,num_workers=num_workers,strict=False)
 
     dem_rasterio_object.close()
     pixel_catchments_rasterio_object.close()
@@ -89,6 +84,7 @@ if __name__ == '__main__':
     parser.add_argument('-d','--dem', help='DEM to use within project path', required=True)
     parser.add_argument('-w','--watersheds',help='Pixel based watersheds raster to use within project path',required=True)
     parser.add_argument('-o','--rem',help='Output REM raster',required=True)
+    parser.add_argument('-j','--num-workers',help='Number of threads computing REM blocks',required=False,default=1,type=int)
     
     # extract to dictionary
     args = vars(parser.parse_args())
@@ -97,5 +93,6 @@ if __name__ == '__main__':
     dem_fileName = args['dem']
     pixel_watersheds_fileName = args['watersheds']
     rem_fileName = args['rem']
+    num_workers = args['num_workers']
 
-    rel_dem(dem_fileName, pixel_watersheds_fileName,rem_fileName)
+    rel_dem(dem_fileName, pixel_watersheds_fileName,rem_fileName,num_workers)
@@ -6,10 +6,16 @@ import numpy as np
 from tqdm import tqdm
 import argparse
 from os.path import splitext
+from multiprocessing import Pool
 from shapely.strtree import STRtree
-from shapely.geometry import Point,MultiLineString,LineString,mapping
+from shapely.geometry import Point,MultiLineString,LineString,mapping,box
+from stream_network_graph import StreamNetworkGraph
+from vector_partitions import read_vector_layer
 
-def subset_vector_layers(hucCode,nwm_streams_fileName,nwm_headwaters_fileName,nhd_streams_fileName,nwm_lakes_fileName,nld_lines_fileName,nwm_catchments_fileName,wbd_fileName,wbd_buffer_fileName,subset_nhd_streams_fileName,subset_nwm_lakes_fileName,subset_nld_lines_fileName,subset_nwm_headwaters_fileName,subset_nwm_catchments_fileName,subset_nwm_streams_fileName,subset_nhd_headwaters_fileName=None,dissolveLinks=False):
+# first search radius of unbounded nearest stream searches, doubled until every point has a stream in range
+initial_search_radius = 1000
+
+def subset_vector_layers(hucCode,nwm_streams_fileName,nwm_headwaters_fileName,nhd_streams_fileName,nwm_lakes_fileName,nld_lines_fileName,nwm_catchments_fileName,wbd_fileName,wbd_buffer_fileName,subset_nhd_streams_fileName,subset_nwm_lakes_fileName,subset_nld_lines_fileName,subset_nwm_headwaters_fileName,subset_nwm_catchments_fileName,subset_nwm_streams_fileName,subset_nhd_headwaters_fileName=None,dissolveLinks=False,max_search_radius=None,num_workers=1):
 
     hucUnitLength = len(str(hucCode))
 
@@ -17,168 +23,257 @@ def subset_vector_layers(hucCode,nwm_streams_fileName,nwm_headwaters_fileName,nh
     wbd_buffer = gpd.read_file(wbd_buffer_fileName)
     projection = wbd.crs
 
-    # find intersecting lakes and writeout
-    print("Subsetting NWM Lakes for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nwm_lakes = gpd.read_file(nwm_lakes_fileName, mask = wbd_buffer)
-    if not nwm_lakes.empty:
-        nwm_lakes.to_file(subset_nwm_lakes_fileName,driver=getDriver(subset_nwm_lakes_fileName),index=False)
-    del nwm_lakes
-    
-    # find intersecting levee lines
-    print("Subsetting NLD levee lines for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nld_lines = gpd.read_file(nld_lines_fileName, mask = wbd)
-    if not nld_lines.empty:
-        nld_lines.to_file(subset_nld_lines_fileName,driver=getDriver(subset_nld_lines_fileName),index=False)
-    del nld_lines
-
-    # find intersecting nwm_catchments
-    print("Subsetting NWM Catchments for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nwm_catchments = gpd.read_file(nwm_catchments_fileName, mask = wbd)
-    nwm_catchments.to_file(subset_nwm_catchments_fileName,driver=getDriver(subset_nwm_catchments_fileName),index=False)
-    del nwm_catchments
-
-    # query nhd+HR streams for HUC code
-    print("Querying NHD Streams for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nhd_streams = gpd.read_file(nhd_streams_fileName, mask = wbd_buffer)
-    nhd_streams = nhd_streams.explode()
-
-    # find intersecting nwm_headwaters
-    print("Subsetting NWM Streams and deriving headwaters for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
-    nwm_streams = gpd.read_file(nwm_streams_fileName, mask = wbd_buffer)
-    nwm_streams.to_file(subset_nwm_streams_fileName,driver=getDriver(subset_nwm_streams_fileName),index=False)
-    nwm_headwaters = gpd.read_file(nwm_headwaters_fileName, mask = wbd_buffer)
-    del nwm_streams
-
-    # get nhd headwaters closest to nwm headwater points
-    print('Identify NHD Headwater streams nearest to NWM Headwater points',flush=True)
-    nhd_streams.loc[:,'is_nwm_headwater'] = False
-    # nhd_streams_tree = STRtree(nhd_streams.geometry)
-    for index, row in tqdm(nwm_headwaters.iterrows(),total=len(nwm_headwaters)):
-        distances = nhd_streams.distance(row['geometry'])
-        # nearestGeom = nhd_streams_tree.nearest(row['geometry'])
-        min_index = np.argmin(distances)
-        nhd_streams.loc[min_index,'is_nwm_headwater'] = True
-
-    # writeout nwm headwaters
-    if not nwm_headwaters.empty:
-        nwm_headwaters.to_file(subset_nwm_headwaters_fileName,driver=getDriver(subset_nwm_headwaters_fileName),index=False)
-    del nwm_headwaters
-
-    # copy over headwater features to nwm streams
-    nhd_streams['is_nwm_stream'] = nhd_streams['is_nwm_headwater'].copy()
-
-    # trace down from NWM Headwaters
-    print('Identify NHD streams downstream of relevant NHD Headwater streams',flush=True)
-    nhd_streams.set_index('NHDPlusID',inplace=True,drop=False)
-
-    Q = deque(nhd_streams.loc[nhd_streams['is_nwm_headwater'],'NHDPlusID'].tolist())
-    visited = set()
-
-    while Q:
-        q = Q.popleft()
-        if q in visited:
-            continue
-        visited.add(q)
-        toNode,DnLevelPat = nhd_streams.loc[q,['ToNode','DnLevelPat']]
-        try:
-            downstream_ids = nhd_streams.loc[nhd_streams['FromNode'] == toNode,:].index.tolist()
-        except ValueError: # 18050002 has duplicate nhd stream feature
-            if len(toNode.unique()) == 1:
-                toNode = toNode.iloc[0]
-                downstream_ids = nhd_streams.loc[nhd_streams['FromNode'] == toNode,:].index.tolist()
-        #If multiple downstream_ids are returned select the ids that are along the main flow path (i.e. exclude segments that are diversions)
-        if len(downstream_ids)>1:
-            relevant_ids = [segment for segment in downstream_ids if DnLevelPat == nhd_streams.loc[segment,'LevelPathI']]
+    # layers independent of the NHD streams are subset on a pool while the NHD streams are processed
+    independent_subsets = [ ("NWM Lakes",nwm_lakes_fileName,wbd_buffer,subset_nwm_lakes_fileName,False),
+                            ("NLD levee lines",nld_lines_fileName,wbd,subset_nld_lines_fileName,False),
+                            ("NWM Catchments",nwm_catchments_fileName,wbd,subset_nwm_catchments_fileName,True),
+                            ("NWM Streams",nwm_streams_fileName,wbd_buffer,subset_nwm_streams_fileName,True) ]
+    independent_subsets = [ (hucUnitLength,hucCode) + subset for subset in independent_subsets ]
+
+    # workers are stopped if the NHD streams fail so no subsets are left half written by orphaned workers
+    pool = Pool(min(num_workers - 1,len(independent_subsets))) if num_workers > 1 else None
+    try:
+        if pool is not None:
+            independent_results = pool.map_async(subset_vector_layer,independent_subsets,chunksize=1)
         else:
-            relevant_ids = downstream_ids
-        nhd_streams.loc[relevant_ids,'is_nwm_stream'] = True
-        for i in relevant_ids:
-            if i not in visited:
-                Q.append(i)
+            for subset in independent_subsets:
+                subset_vector_layer(subset)
+
+        # query nhd+HR streams for HUC code
+        print("Querying NHD Streams for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
+        nhd_streams = read_vector_layer(nhd_streams_fileName, mask = wbd_buffer)
+        nhd_streams = nhd_streams.explode()
+
+        # find intersecting nwm_headwaters
+        print("Subsetting NWM headwaters for HUC{} {}".format(hucUnitLength,hucCode),flush=True)
+        nwm_headwaters = read_vector_layer(nwm_headwaters_fileName, mask = wbd_buffer)
+
+        # get nhd headwaters closest to nwm headwater points
+        print('Identify NHD Headwater streams nearest to NWM Headwater points',flush=True)
+        nhd_streams.loc[:,'is_nwm_headwater'] = False
+        nearest_streams = find_nearest_streams(nwm_headwaters,nhd_streams,max_search_radius)
+        if (max_search_radius is not None) and (nearest_streams < 0).any():
+            print('{} NWM Headwater points have no NHD stream within {}'.format((nearest_streams < 0).sum(),max_search_radius),flush=True)
+        is_nwm_headwater = np.zeros(len(nhd_streams),dtype=bool)
+        is_nwm_headwater[nearest_streams[nearest_streams >= 0]] = True
+        nhd_streams.loc[:,'is_nwm_headwater'] = is_nwm_headwater
+
+        # writeout nwm headwaters
+        if not nwm_headwaters.empty:
+            nwm_headwaters.to_file(subset_nwm_headwaters_fileName,driver=getDriver(subset_nwm_headwaters_fileName),index=False)
+        del nwm_headwaters
+
+        # trace down from NWM Headwaters
+        print('Identify NHD streams downstream of relevant NHD Headwater streams',flush=True)
+        nhd_streams.set_index('NHDPlusID',inplace=True,drop=False)
 
-    nhd_streams = nhd_streams.loc[nhd_streams['is_nwm_stream'],:]
+        nhd_streams['is_nwm_stream'] = trace_nwm_streams(nhd_streams)
 
-    if dissolveLinks:
-        # remove multi-line strings
-        print("Dissolving NHD reaches to Links (reaches constrained to stream intersections)",flush=True)
+        nhd_streams = nhd_streams.loc[nhd_streams['is_nwm_stream'],:]
 
-        nhd_streams.set_index('NHDPlusID',inplace=True,drop=False)
-        nhd_streams['before_confluence'] = nhd_streams.duplicated(subset='ToNode',keep=False)
+        # headwater streams are taken before dissolving since links do not keep stream attributes
+        if subset_nhd_headwaters_fileName is not None:
+            nhd_headwater_streams = nhd_streams.loc[nhd_streams['is_nwm_headwater'],:]
+
+        if dissolveLinks:
+            # remove multi-line strings
+            print("Dissolving NHD reaches to Links (reaches constrained to stream intersections)",flush=True)
+
+            link_numbers, link_geometries = dissolve_links(nhd_streams)
+
+            nhd_streams = gpd.GeoDataFrame({'linkNO' : link_numbers,'geometry': link_geometries},geometry='geometry',crs=projection)
+
+        # write to files
+        nhd_streams.reset_index(drop=True,inplace=True)
+        nhd_streams.to_file(subset_nhd_streams_fileName,driver=getDriver(subset_nhd_streams_fileName),index=False)
+
+        if subset_nhd_headwaters_fileName is not None:
+            # identify all nhd headwaters
+            print('Identify NHD headwater points',flush=True)
+            nhd_headwater_streams = nhd_headwater_streams.explode()
+
+            hw_points = np.zeros(len(nhd_headwater_streams),dtype=object)
+            for index,lineString in enumerate(nhd_headwater_streams.geometry):
+                hw_point = [point for point in zip(*lineString.coords.xy)][-1]
+                hw_points[index] = Point(*hw_point)
+
+            nhd_headwater_points = gpd.GeoDataFrame({'NHDPlusID' : nhd_headwater_streams['NHDPlusID'],
+                                                    'geometry' : hw_points},geometry='geometry',crs=projection)
+
+            nhd_headwater_points.to_file(subset_nhd_headwaters_fileName,driver=getDriver(subset_nhd_headwaters_fileName),index=False)
+            del nhd_headwater_streams, nhd_headwater_points
+
+        if pool is not None:
+            independent_results.get()
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def subset_vector_layer(args):
+
+    """ Reads features of a layer intersecting mask and writes them out. Empty subsets are only written if write_empty. """
+
+    hucUnitLength, hucCode, layer_description, layer_fileName, mask, subset_fileName, write_empty = args
+
+    print("Subsetting {} for HUC{} {}".format(layer_description,hucUnitLength,hucCode),flush=True)
+    layer = read_vector_layer(layer_fileName, mask = mask)
+    if write_empty or not layer.empty:
+        layer.to_file(subset_fileName,driver=getDriver(subset_fileName),index=False)
+
+
+def trace_nwm_streams(streams):
+
+    """
+        Marks NHD streams downstream of NWM headwater streams. Where a stream has multiple downstream streams only the
+        ones along its main flow path (LevelPathI equal to its DnLevelPat) are followed. Features sharing an NHDPlusID
+        are marked together.
+
+        Parameters
+        ----------
+        streams : GeoDataFrame
+            NHD streams with NHDPlusID, FromNode, ToNode, LevelPathI, DnLevelPat and is_nwm_headwater.
+
+        Returns
+        -------
+        numpy array
+            Boolean mask of NWM streams in streams order.
+
+    """
+
+    graph = StreamNetworkGraph.from_nodes(streams['FromNode'].values,streams['ToNode'].values,streams['NHDPlusID'].values)
 
-        nhd_streams.loc[nhd_streams['is_nwm_headwater'],'linkNo'] = np.arange(1,nhd_streams['is_nwm_headwater'].sum()+1)
+    # exclude segments that are diversions
+    edge_sources = np.repeat(np.arange(len(graph)),np.diff(graph.indptr))
+    is_single_downstream = np.diff(graph.indptr)[edge_sources] == 1
+    is_main_path = streams['DnLevelPat'].values[edge_sources] == streams['LevelPathI'].values[graph.indices]
 
-        Q = deque(nhd_streams.loc[nhd_streams['is_nwm_headwater'],'NHDPlusID'].tolist())
-        visited = set()
-        linkNo = np.max(nhd_streams.loc[nhd_streams['is_nwm_headwater'],'linkNo']) + 1
-        link_geometries = dict()
+    is_nwm_stream = graph.trace_downstream(streams['is_nwm_headwater'].values,edge_mask=is_single_downstream | is_main_path)
 
-        # adds all headwaters to link_geometries
-        for q in Q:
-            link_geometries[nhd_streams.loc[q,'linkNo']] = [p for p in zip(*nhd_streams.loc[q,'geometry'].coords.xy)][::-1]
+    # 18050002 has duplicate nhd stream feature
+    return(np.isin(graph.ids,graph.ids[is_nwm_stream]))
 
-        # Do BFS
-        while Q:
-            q = Q.popleft()
 
-            if q in visited:
-                continue
+def dissolve_links(streams):
 
-            visited.add(q)
+    """
+        Dissolves streams to links, reaches constrained to stream intersections. A stream continues the link of its
+        upstream stream unless it is a headwater, it is below a confluence, or its upstream stream splits.
+        Stream coordinates are reversed and chained in downstream order.
 
-            toNode = nhd_streams.loc[q,'ToNode']
+        Returns link numbers and link LineStrings. Headwater links are numbered first in table order, then the other
+        links in upstream to downstream order. If the streams have a cycle a warning is printed and streams on or below
+        cycles are ordered after the rest in table order.
+    """
 
-            downstream_ids = nhd_streams.loc[nhd_streams['FromNode'] == toNode,:].index.tolist()
-            numberOfDownstreamIDs = len(downstream_ids)
+    graph = StreamNetworkGraph.from_nodes(streams['FromNode'].values,streams['ToNode'].values)
+    is_headwater = streams['is_nwm_headwater'].values.astype(bool)
 
-            for i in downstream_ids:
-                if i not in visited:
-                    Q.append(i)
+    # only streams reached from headwaters are part of links
+    reached = np.flatnonzero(graph.trace_downstream(is_headwater))
+    graph = StreamNetworkGraph.from_nodes(streams['FromNode'].values[reached],streams['ToNode'].values[reached])
+    is_headwater = is_headwater[reached]
+    nstreams = len(reached)
 
-                    if nhd_streams.loc[q,'before_confluence'] or (numberOfDownstreamIDs > 1):
-                        # do not dissolve
-                        linkNo += 1
-                        nhd_streams.loc[i,'linkNo'] = linkNo
+    # link starts
+    in_degree = np.diff(graph.up_indptr)
+    out_degree = np.diff(graph.indptr)
+    upstream = np.full(nstreams,-1,dtype=np.int64)
+    single_upstream = in_degree == 1
+    upstream[single_upstream] = graph.up_indices[graph.up_indptr[:-1][single_upstream]]
+    is_link_start = is_headwater | ~single_upstream
+    is_link_start[~is_link_start] = out_degree[upstream[~is_link_start]] != 1
 
-                        next_stream_geometry = [p for p in zip(*nhd_streams.loc[i,'geometry'].coords.xy)][::-1]
+    # every stream points to the start of its link
+    link_start = np.where(is_link_start,np.arange(nstreams),upstream)
+    for _ in range(int(np.ceil(np.log2(max(nstreams,2)))) + 1):
+        link_start = link_start[link_start]
 
-                        link_geometries[linkNo] = next_stream_geometry
+    # headwater links first in table order, then links in traversal order
+    try:
+        topological_order = graph.topological_order()
+    except ValueError:
+        print('Warning: NHD streams have a cycle in FromNode/ToNode. Streams on or below the cycle are ordered by table position',flush=True)
+        topological_order = graph.topological_order(break_cycles=True)
+    topological_rank = np.empty(nstreams,dtype=np.int64)
+    topological_rank[topological_order] = np.arange(nstreams)
+    starts = np.flatnonzero(is_link_start)
+    starts = starts[np.lexsort((np.where(is_headwater[starts],starts,topological_rank[starts]),~is_headwater[starts]))]
+    link_index = np.empty(nstreams,dtype=np.int64)
+    link_index[starts] = np.arange(len(starts))
+    link_index = link_index[link_start]
 
-                    else:
-                        nhd_streams.loc[i,'linkNo'] = nhd_streams.loc[q,'linkNo']
+    # gather reversed coordinates of streams ordered by link and position along link, concatenate once
+    stream_order = np.lexsort((topological_rank,link_index))
+    geometries = streams.geometry.values[reached[stream_order]]
+    stream_coordinates = [ np.asarray(g.coords)[::-1,:2] for g in geometries ]
+    counts = np.array([ len(c) for c in stream_coordinates ],dtype=np.int64)
+    coordinates = np.concatenate(stream_coordinates)
+    link_counts = np.bincount(link_index[stream_order],weights=counts,minlength=len(starts)).astype(np.int64)
+    link_ends = np.cumsum(link_counts)
+    link_begins = link_ends - link_counts
 
-                        next_stream_geometry = [p for p in zip(*nhd_streams.loc[i,'geometry'].coords.xy)][::-1]
+    link_geometries = [ LineString(coordinates[b:e]) for b,e in zip(link_begins,link_ends) ]
+    link_numbers = np.arange(1,len(starts)+1)
 
-                        link_geometries[nhd_streams.loc[i,'linkNo']] = link_geometries[nhd_streams.loc[i,'linkNo']] + next_stream_geometry
+    return(link_numbers,link_geometries)
 
 
-        # convert dictionary to lists for keys (linkNos) and values (geometry linestrings)
-        output_links = [] ; output_geometries = []
-        for ln_no, ln_geom in link_geometries.items():
-            output_links = output_links + [ln_no]
-            output_geometries = output_geometries + [LineString(ln_geom)]
+def find_nearest_streams(points,streams,max_search_radius=None):
 
-        nhd_streams = gpd.GeoDataFrame({'linkNO' : output_links,'geometry': output_geometries},geometry='geometry',crs=projection)
+    """
+        Finds the nearest stream to each point with a spatial index. Streams are candidates when their bounding box
+        is within the search radius of the point. Ties in distance go to the lowest NHDPlusID, then the first stream.
+
+        Without max_search_radius the search is unbounded. The radius starts at initial_search_radius and doubles for
+        points without a stream in range, which gives the same result as comparing the point to every stream.
 
-    # write to files
-    nhd_streams.reset_index(drop=True,inplace=True)
-    nhd_streams.to_file(subset_nhd_streams_fileName,driver=getDriver(subset_nhd_streams_fileName),index=False)
+        Returns position of the nearest stream for each point, -1 if none is within max_search_radius.
+    """
 
-    if subset_nhd_headwaters_fileName is not None:
-        # identify all nhd headwaters
-        print('Identify NHD headwater points',flush=True)
-        nhd_headwater_streams = nhd_streams.loc[nhd_streams['is_nwm_headwater'],:]
-        nhd_headwater_streams = nhd_headwater_streams.explode()
+    nearest = np.full(len(points),-1,dtype=np.int64)
+    if len(points) == 0 or len(streams) == 0:
+        return(nearest)
 
-        hw_points = np.zeros(len(nhd_headwater_streams),dtype=object)
-        for index,lineString in enumerate(nhd_headwater_streams.geometry):
-            hw_point = [point for point in zip(*lineString.coords.xy)][-1]
-            hw_points[index] = Point(*hw_point)
+    x, y = points.geometry.x.values, points.geometry.y.values
+    tie_ids = streams['NHDPlusID'].values if 'NHDPlusID' in streams.columns else np.arange(len(streams))
 
-        nhd_headwater_points = gpd.GeoDataFrame({'NHDPlusID' : nhd_headwater_streams['NHDPlusID'],
-                                                'geometry' : hw_points},geometry='geometry',crs=projection)
+    if max_search_radius is None:
+        # any stream is within the diagonal of the combined extent of points and streams
+        minx, miny, maxx, maxy = streams.total_bounds
+        extent = np.hypot(max(maxx,x.max()) - min(minx,x.min()),max(maxy,y.max()) - min(miny,y.min()))
+        search_radius, final_radius = min(initial_search_radius,max(extent,1.0)), max(extent,1.0)
+    else:
+        search_radius = final_radius = max_search_radius
+
+    unmatched = np.arange(len(points))
+    while len(unmatched) > 0:
+
+        # candidate pairs from one bulk query of search windows against the stream index
+        search_windows = [ box(xi - search_radius,yi - search_radius,xi + search_radius,yi + search_radius) for xi,yi in zip(x[unmatched],y[unmatched]) ]
+        point_positions, stream_positions = streams.sindex.query_bulk(search_windows)
+        point_positions = unmatched[point_positions]
+
+        distances = streams.geometry.values[stream_positions].distance(points.geometry.values[point_positions])
+        within_radius = distances <= search_radius
+        point_positions, stream_positions, distances = point_positions[within_radius], stream_positions[within_radius], distances[within_radius]
+
+        # sort by point, distance, then tie rule and keep the first candidate of each point
+        order = np.lexsort((stream_positions,tie_ids[stream_positions],distances,point_positions))
+        point_positions, stream_positions = point_positions[order], stream_positions[order]
+        first = np.r_[True,point_positions[1:] != point_positions[:-1]] if len(point_positions) > 0 else np.zeros(0,dtype=bool)
+        nearest[point_positions[first]] = stream_positions[first]
+
+        if search_radius >= final_radius:
+            break
+
+        unmatched = unmatched[nearest[unmatched] < 0]
+        search_radius = min(search_radius * 2,final_radius)
+
+    return(nearest)
 
-        nhd_headwater_points.to_file(subset_nhd_headwaters_fileName,driver=getDriver(subset_nhd_headwaters_fileName),index=False)
-        del nhd_headwater_streams, nhd_headwater_points
 
 def getDriver(fileName):
 
@@ -208,6 +303,8 @@ if __name__ == '__main__':
     parser.add_argument('-n','--subset-catchments',help='NWM catchments subset',required=True)
     parser.add_argument('-b','--subset-nwm-streams',help='NWM streams subset',required=True)
     parser.add_argument('-o','--dissolve-links',help='remove multi-line strings',action="store_true",default=False)
+    parser.add_argument('-j','--num-workers',help='Number of processes to subset layers with',required=False,type=int,default=1)
+    parser.add_argument('-x','--max-search-radius',help='Max distance from NWM headwater points to NHD streams. Unbounded by default',required=False,type=float,default=None)
 
     args = vars(parser.parse_args())
 
@@ -228,5 +325,7 @@ if __name__ == '__main__':
     subset_nhd_headwaters_fileName = args['subset_nhd_headwaters']
     subset_nwm_streams_fileName = args['subset_nwm_streams']
     dissolveLinks = args['dissolve_links']
+    max_search_radius = args['max_search_radius']
+    num_workers = args['num_workers']
 
-    subset_vector_layers(hucCode,nwm_streams_fileName,nwm_headwaters_fileName,nhd_streams_fileName,nwm_lakes_fileName,nld_lines_fileName,nwm_catchments_fileName,wbd_fileName,wbd_buffer_fileName,subset_nhd_streams_fileName,subset_nwm_lakes_fileName,subset_nld_lines_fileName,subset_nwm_headwaters_fileName,subset_nwm_catchments_fileName,subset_nwm_streams_fileName,subset_nhd_headwaters_fileName,dissolveLinks)
+    subset_vector_layers(hucCode,nwm_streams_fileName,nwm_headwaters_fileName,nhd_streams_fileName,nwm_lakes_fileName,nld_lines_fileName,nwm_catchments_fileName,wbd_fileName,wbd_buffer_fileName,subset_nhd_streams_fileName,subset_nwm_lakes_fileName,subset_nld_lines_fileName,subset_nwm_headwaters_fileName,subset_nwm_catchments_fileName,subset_nwm_streams_fileName,subset_nhd_headwaters_fileName,dissolveLinks,max_search_radius,num_workers)
@@ -13,7 +13,10 @@ import sys
 import geopandas as gpd
 import pandas as pd
 from shapely.geometry import Point, LineString, MultiPoint
+from shapely.ops import unary_union
 import rasterio
+from rasterio.windows import Window
+from rasterio.transform import rowcol
 import numpy as np
 import argparse
 from tqdm import tqdm
@@ -21,182 +24,401 @@ import time
 from os.path import isfile
 from os import remove
 from collections import OrderedDict
+from multiprocessing import Pool
 import buildstreamtraversal
 
-flows_fileName         = sys.argv[1] # $outputDataDir/demDerived_reaches.gpkg
-dem_fileName           = sys.argv[2] # $outputDataDir/dem_thalwegCond.tif
-split_flows_fileName   = sys.argv[3] # $outputDataDir/demDerived_reaches_split.gpkg
-split_points_fileName  = sys.argv[4] # $outputDataDir/demDerived_reaches_split_points.gpkg
-maxLength              = float(sys.argv[5])
-slope_min              = float(sys.argv[6])
-huc8_filename          = sys.argv[7] # $outputDataDir/wbd8_projected.gpkg
-lakes_filename         = sys.argv[8] # $outputDataDir/nwm_lakes_proj_clp.gpkg
-
 toMetersConversion = 1e-3
-
-print('Loading data ...')
-flows = gpd.read_file(flows_fileName)
-WBD8 = gpd.read_file(huc8_filename)
-#dem = Raster(dem_fileName)
-dem = rasterio.open(dem_fileName,'r')
-if isfile(lakes_filename):
-    lakes = gpd.read_file(lakes_filename)
-else:
-    lakes = None
-
-WBD8 = WBD8.filter(items=['fossid', 'geometry'])
-WBD8 = WBD8.set_index('fossid')
-flows = flows.explode()
-
-# temp
-flows = flows.to_crs(WBD8.crs)
-
-split_flows = []
-slopes = []
 HYDROID = 'HydroID'
-split_endpoints = OrderedDict()
-# check for lake features
-if lakes is not None:
-    if len(lakes) > 0:
-      print ('splitting stream segments at ' + str(len(lakes)) + ' waterbodies')
-      #create splits at lake boundaries
-      lakes = lakes.filter(items=['newID', 'geometry'])
-      lakes = lakes.set_index('newID')
-      flows = gpd.overlay(flows, lakes, how='union').explode().reset_index(drop=True)
 
-print ('splitting ' + str(len(flows)) + ' stream segments based on ' + str(maxLength) + ' m max length')
 
-# remove empty geometries
-flows = flows.loc[~flows.is_empty,:]
+def split_flows(flows,dem_fileName,maxLength,slope_min,WBD8,lakes=None,num_workers=1):
+    """
+        Splits stream segments at lakes and by max length, calculates slopes and creates HydroIDs and split points
+
+        Flows are partitioned by the WBD8 unit (fossid) their centroids fall in and partitions are split in a process pool.
+        Segments are put back in input order before HydroIDs are assigned so numbering does not depend on num_workers.
+
+        Parameters
+        ----------
+        flows : GeoDataFrame or str
+            Stream reaches or file name of stream reaches (ie demDerived_reaches.shp).
+        dem_fileName : str
+            File name of DEM to calculate slopes from (ie dem_thalwegCond.tif).
+        maxLength : float
+            Maximum length of split segments in units of WBD8 projection.
+        slope_min : float
+            Minimum slope of split segments.
+        WBD8 : GeoDataFrame or str
+            HUC8 boundaries with fossid or file name of HUC8 boundaries.
+        lakes : GeoDataFrame or str, optional
+            Lakes with newID or file name of lakes. Lakes are not used if None or the file does not exist.
+        num_workers : int, optional
+            Number of processes to split partitions with.
+
+        Returns
+        -------
+        split_flows_gdf : GeoDataFrame
+            Split stream segments with HydroID and network traversal attributes.
+        split_points_gdf : GeoDataFrame
+            Vertices of split stream segments encoded with HydroIDs.
+
+    """
+
+    print('Loading data ...')
+    if isinstance(flows,str):
+        flows = gpd.read_file(flows)
+    if isinstance(WBD8,str):
+        WBD8 = gpd.read_file(WBD8)
+    if isinstance(lakes,str):
+        if isfile(lakes):
+            lakes = gpd.read_file(lakes)
+        else:
+            lakes = None
+
+    WBD8 = WBD8.filter(items=['fossid', 'geometry'])
+    WBD8 = WBD8.set_index('fossid')
+    flows = flows.explode().reset_index(drop=True)
+
+    # temp
+    flows = flows.to_crs(WBD8.crs)
+
+    # check for lake features
+    if lakes is not None:
+        if len(lakes) > 0:
+          print ('splitting stream segments at ' + str(len(lakes)) + ' waterbodies')
+          #create splits at lake boundaries
+          lakes = lakes.filter(items=['newID', 'geometry'])
+          lakes = lakes.set_index('newID')
+          flows = split_flows_at_lakes(flows, lakes)
+
+    if 'LakeID' not in flows.columns:
+        flows['LakeID'] = -999
+
+    print ('splitting ' + str(len(flows)) + ' stream segments based on ' + str(maxLength) + ' m max length')
+
+    # remove empty geometries
+    flows = flows.loc[~flows.is_empty,:].reset_index(drop=True)
+
+    # partition flows by the HUC8 their centroid falls in
+    flow_centroids = gpd.GeoDataFrame({'geometry':flows.geometry.centroid}, crs=flows.crs, geometry='geometry')
+    flow_partitions = gpd.sjoin(flow_centroids, WBD8, how='left', op='within')
+    flow_partitions = flow_partitions.loc[~flow_partitions.index.duplicated(keep='first'),'index_right'].fillna('')
+    partition_positions = [ positions for _,positions in pd.Series(np.arange(len(flows)),index=flow_partitions.values).groupby(level=0) ]
+
+    partitions = [ (flows.geometry.values[positions.values],dem_fileName,maxLength,slope_min) for positions in partition_positions ]
+
+    if num_workers > 1:
+        with Pool(num_workers) as pool:
+            partition_results = pool.map(split_partition,partitions)
+    else:
+        partition_results = [ split_partition(p) for p in tqdm(partitions) ]
+
+    # put segments back in input flow order
+    segment_flow_positions = np.concatenate([ np.repeat(positions.values,counts) for positions,(_,_,counts) in zip(partition_positions,partition_results) ])
+    segment_order = np.argsort(segment_flow_positions,kind='stable')
+
+    segment_geometries = [ g for geometries,_,_ in partition_results for g in geometries ]
+    segment_geometries = [ segment_geometries[i] for i in segment_order ]
+    slopes = np.concatenate([ partition_slopes for _,partition_slopes,_ in partition_results ])[segment_order]
+    lake_ids = flows['LakeID'].values[segment_flow_positions][segment_order]
+
+    split_flows_gdf = gpd.GeoDataFrame({'S0' : slopes, 'geometry' : segment_geometries}, crs=flows.crs, geometry='geometry')
+    split_flows_gdf['LengthKm'] = split_flows_gdf.geometry.length * toMetersConversion
+    split_flows_gdf['LakeID'] = lake_ids
+
+    # Create Ids and Network Traversal Columns
+    addattributes = buildstreamtraversal.BuildStreamTraversalColumns()
+    tResults=None
+    tResults = addattributes.execute(split_flows_gdf, WBD8, HYDROID)
+    if tResults[0] == 'OK':
+        split_flows_gdf = tResults[1]
+    else:
+        print ('Error: Could not add network attributes to stream segments')
+
+    # Get Outlet Point Only
+    #outlet = OrderedDict()
+    #for i,segment in split_flows_gdf.iterrows():
+    #    outlet[segment.geometry.coords[-1]] = segment[HYDROID]
+
+    #hydroIDs_points = [hidp for hidp in outlet.values()]
+    #split_points = [Point(*point) for point in outlet]
+
+    # Get all vertices
+    split_points = OrderedDict()
+    for row in split_flows_gdf[['geometry',HYDROID, 'NextDownID']].iterrows():
+        lineString = row[1][0]
+
+        for point in zip(*lineString.coords.xy):
+            if point in split_points:
+                if row[1][2] == split_points[point]:
+                    pass
+                else:
+                    split_points[point] = row[1][1]
+            else:
+                split_points[point] = row[1][1]
+
+    hydroIDs_points = [hidp for hidp in split_points.values()]
+    split_points = [Point(*point) for point in split_points]
+
+    split_points_gdf = gpd.GeoDataFrame({'id': hydroIDs_points , 'geometry':split_points}, crs=flows.crs, geometry='geometry')
+
+    return(split_flows_gdf,split_points_gdf)
+
+
+def split_flows_at_lakes(flows,lakes):
+    """
+        Splits stream reaches at lake boundaries and assigns LakeIDs
+
+        Lakes intersecting the reaches are found with one bulk query of the lakes spatial index so only those reaches are split.
+        Pieces inside a lake get the lake's newID as LakeID and pieces outside of lakes get -999. LakeID keeps the integer
+        type of the lakes index. Pieces inside lakes come first, by reach and then lake, followed by pieces outside of lakes.
+        Piece geometries and order are not those of a union overlay, so segments and their HydroIDs can differ from it.
+
+        Parameters
+        ----------
+        flows : GeoDataFrame
+            Stream reaches.
+        lakes : GeoDataFrame
+            Lake polygons indexed by newID.
+
+        Returns
+        -------
+        flows : GeoDataFrame
+            Single part stream reaches with LakeID.
+
+    """
+
+    lake_geometries = lakes.geometry.values
+    lake_ids = lakes.index.values
+
+    # one bulk query for all reaches. hits grouped by reach with lakes in index order
+    flow_positions, lake_positions = lakes.sindex.query_bulk(flows.geometry,predicate='intersects')
+    hit_order = np.lexsort((lake_positions,flow_positions))
+    flow_positions, lake_positions = flow_positions[hit_order], lake_positions[hit_order]
+    hit_bounds = np.searchsorted(flow_positions,np.arange(len(flows) + 1))
+
+    inside_geometries, inside_lake_ids, outside_geometries = [], [], []
+    for i,lineString in enumerate(flows.geometry):
+
+        intersecting_lakes = lake_positions[hit_bounds[i]:hit_bounds[i + 1]]
+
+        if len(intersecting_lakes) == 0:
+            outside_geometries.append(lineString)
+            continue
+
+        for lake_position in intersecting_lakes:
+            pieces = line_parts(lineString.intersection(lake_geometries[lake_position]))
+            inside_geometries.extend(pieces)
+            inside_lake_ids.extend([lake_ids[lake_position]] * len(pieces))
+
+        outside_geometries.extend(line_parts(lineString.difference(unary_union(list(lake_geometries[intersecting_lakes])))))
+
+    split_flows_gdf = gpd.GeoDataFrame({'LakeID' : np.concatenate((np.array(inside_lake_ids,dtype=lake_ids.dtype),np.full(len(outside_geometries),-999,dtype=lake_ids.dtype))),
+                                        'geometry' : inside_geometries + outside_geometries}, crs=flows.crs, geometry='geometry')
+
+    return(split_flows_gdf)
+
+
+def line_parts(geometry):
+    """ Returns the non-empty LineString parts of a geometry """
+
+    if geometry.is_empty:
+        return([])
+    if geometry.geom_type == 'LineString':
+        return([geometry])
+    if geometry.geom_type in ('MultiLineString','GeometryCollection'):
+        return([g for g in geometry.geoms if (g.geom_type == 'LineString') and (not g.is_empty)])
+
+    return([])
+
+
+def split_partition(args):
+    """
+        Splits a partition of stream reaches and calculates segment slopes. Designed for use in multiprocessing.
+
+        Parameters
+        ----------
+        args : tuple
+            Reach geometries, DEM file name, maxLength, and slope_min.
+
+        Returns
+        -------
+        geometries : list
+            Split segment LineStrings.
+        slopes : numpy array
+            Segment slopes.
+        counts : numpy array
+            Number of segments for each reach.
+
+    """
 
-for i,lineString in tqdm(enumerate(flows.geometry),total=len(flows.geometry)):
-    # Reverse geometry order (necessary for BurnLines)
-    lineString = LineString(lineString.coords[::-1])
+    flow_geometries, dem_fileName, maxLength, slope_min = args
+
+    segments, counts = [], np.zeros(len(flow_geometries),dtype=np.int64)
+    for i,lineString in enumerate(flow_geometries):
+        # Reverse geometry order (necessary for BurnLines)
+        line_coordinates = np.array(lineString.coords)[::-1,:2]
+
+        line_segments = split_line_at_vertices(line_coordinates,maxLength)
+        segments.extend(line_segments)
+        counts[i] = len(line_segments)
+
+    if len(segments) == 0:
+        return([],np.array([],dtype=float),counts)
+
+    split_points_start = np.array([segment[0] for segment in segments])
+    split_points_end = np.array([segment[-1] for segment in segments])
+    geometries = [LineString(segment) for segment in segments]
+    lengths = gpd.GeoSeries(geometries).length.values
+
+    # Calculate channel slope from start and end point elevations sampled in one batch
+    with rasterio.open(dem_fileName,'r') as dem:
+        # float so differences of integer DEMs do not overflow
+        elevations = sample_raster_at_points(dem,np.concatenate((split_points_start,split_points_end))).astype(float)
+    start_elevs, end_elevs = elevations[:len(segments)], elevations[len(segments):]
+    slopes = np.abs(start_elevs - end_elevs) / lengths
+    slopes = np.where(slopes < slope_min, slope_min, slopes).astype(float)
+
+    return(geometries,slopes,counts)
+
+
+def split_line_at_vertices(line_coordinates,maxLength):
+    """
+        Splits a line into segments of roughly equal length that are cut at existing vertices
+
+        A segment ends at the first vertex where its length reaches the split length (line length divided into the fewest
+        pieces under maxLength). Lines shorter than maxLength are returned whole and zero length lines are dropped.
+
+        Parameters
+        ----------
+        line_coordinates : numpy array
+            Array of line vertices with shape (n,2).
+        maxLength : float
+            Maximum length of segments.
+
+        Returns
+        -------
+        segments : list
+            List of vertex arrays, one for each segment.
+
+    """
+
+    # vertex to vertex lengths and lengths along line. summed in the same order as shapely's length
+    delta = np.diff(line_coordinates,axis=0)
+    vertex_lengths = np.sqrt(delta[:,0]*delta[:,0] + delta[:,1]*delta[:,1])
+    cumulative_lengths = np.concatenate(([0],np.cumsum(vertex_lengths)))
+    line_length = cumulative_lengths[-1]
 
     # skip lines of zero length
-    if lineString.length == 0:
-        continue
+    if line_length == 0:
+        return([])
 
     # existing reaches of less than maxLength
-    if lineString.length < maxLength:
-        split_flows = split_flows + [lineString]
-        line_points = [point for point in zip(*lineString.coords.xy)]
+    if line_length < maxLength:
+        return([line_coordinates])
 
-        # Calculate channel slope
-        start_point = line_points[0]; end_point = line_points[-1]
-        start_elev,end_elev = [i[0] for i in rasterio.sample.sample_gen(dem,[start_point,end_point])]
-        slope = float(abs(start_elev - end_elev) / lineString.length)
-        if slope < slope_min:
-            slope = slope_min
-        slopes = slopes + [slope]
-        continue
+    splitLength = line_length / np.ceil(line_length / maxLength)
 
-    splitLength = lineString.length / np.ceil(lineString.length / maxLength)
+    segments = []
+    start_index = 0 ; last_index = len(line_coordinates) - 1
+    while start_index < last_index:
 
-    cumulative_line = []
-    line_points = []
-    last_point = []
+        # segment lengths are re-summed from the cut vertex so thresholds match measuring each segment on its own
+        stop_index = min(np.searchsorted(cumulative_lengths,cumulative_lengths[start_index] + splitLength) + 2,last_index)
+        segment_lengths = np.cumsum(vertex_lengths[start_index:stop_index])
+        end_offset = np.searchsorted(segment_lengths,splitLength,side='left')
 
-    last_point_in_entire_lineString = list(zip(*lineString.coords.xy))[-1]
+        if (end_offset == len(segment_lengths)) & (stop_index < last_index):
+            segment_lengths = np.cumsum(vertex_lengths[start_index:])
+            end_offset = np.searchsorted(segment_lengths,splitLength,side='left')
 
-    for point in zip(*lineString.coords.xy):
+        # remainder is shorter than the split length
+        if end_offset == len(segment_lengths):
+            if segment_lengths[-1] > 0:
+                segments.append(line_coordinates[start_index:])
+            break
 
-        cumulative_line = cumulative_line + [point]
-        line_points = line_points + [point]
-        numberOfPoints_in_cumulative_line = len(cumulative_line)
+        end_index = start_index + end_offset + 1
+        segments.append(line_coordinates[start_index:end_index+1])
+        start_index = end_index
 
-        if last_point:
-            cumulative_line = [last_point] + cumulative_line
-            numberOfPoints_in_cumulative_line = len(cumulative_line)
-        elif numberOfPoints_in_cumulative_line == 1:
-            continue
+    return(segments)
 
-        cumulative_length = LineString(cumulative_line).length
-
-        if cumulative_length >= splitLength:
-
-            splitLineString = LineString(cumulative_line)
-            split_flows = split_flows + [splitLineString]
-
-            # Calculate channel slope
-            start_point = cumulative_line[0]; end_point = cumulative_line[-1]
-            start_elev,end_elev = [i[0] for i in rasterio.sample.sample_gen(dem,[start_point,end_point])]
-            slope = float(abs(start_elev - end_elev) / splitLineString.length)
-            if slope < slope_min:
-                slope = slope_min
-            slopes = slopes + [slope]
-
-            last_point = end_point
-
-            if (last_point == last_point_in_entire_lineString):
-                continue
-
-            cumulative_line = []
-            line_points = []
-
-    splitLineString = LineString(cumulative_line)
-    split_flows = split_flows + [splitLineString]
-
-    # Calculate channel slope
-    start_point = cumulative_line[0]; end_point = cumulative_line[-1]
-    start_elev,end_elev = [i[0] for i in rasterio.sample.sample_gen(dem,[start_point,end_point])]
-    slope = float(abs(start_elev - end_elev) / splitLineString.length)
-    if slope < slope_min:
-        slope = slope_min
-    slopes = slopes + [slope]
-
-split_flows_gdf = gpd.GeoDataFrame({'S0' : slopes ,'geometry':split_flows}, crs=flows.crs, geometry='geometry')
-split_flows_gdf['LengthKm'] = split_flows_gdf.geometry.length * toMetersConversion
-if lakes is not None:
-    split_flows_gdf = gpd.sjoin(split_flows_gdf, lakes, how='left', op='within')
-    split_flows_gdf = split_flows_gdf.rename(columns={"index_right": "LakeID"}).fillna(-999)
-else:
-    split_flows_gdf['LakeID'] = -999
-
-# Create Ids and Network Traversal Columns
-addattributes = buildstreamtraversal.BuildStreamTraversalColumns()
-tResults=None
-tResults = addattributes.execute(split_flows_gdf, WBD8, HYDROID)
-if tResults[0] == 'OK':
-    split_flows_gdf = tResults[1]
-else:
-    print ('Error: Could not add network attributes to stream segments')
-
-# Get Outlet Point Only
-#outlet = OrderedDict()
-#for i,segment in split_flows_gdf.iterrows():
-#    outlet[segment.geometry.coords[-1]] = segment[HYDROID]
-
-#hydroIDs_points = [hidp for hidp in outlet.values()]
-#split_points = [Point(*point) for point in outlet]
-
-# Get all vertices
-split_points = OrderedDict()
-for row in split_flows_gdf[['geometry',HYDROID, 'NextDownID']].iterrows():
-    lineString = row[1][0]
-
-    for point in zip(*lineString.coords.xy):
-        if point in split_points:
-            if row[1][2] == split_points[point]:
-                pass
-            else:
-                split_points[point] = row[1][1]
-        else:
-            split_points[point] = row[1][1]
 
-hydroIDs_points = [hidp for hidp in split_points.values()]
-split_points = [Point(*point) for point in split_points]
+def sample_raster_at_points(raster,points):
+    """
+        Samples a rasterio dataset at many points, reading each block with points only once
+
+        Points are indexed like rasterio.sample.sample_gen. Points outside of the raster are assigned the no data value (or 0).
+
+        Parameters
+        ----------
+        raster : rasterio dataset
+            Open single band raster to sample.
+        points : numpy array
+            Array of point coordinates with shape (n,2). May be empty.
+
+        Returns
+        -------
+        values : numpy array
+            Raster values at points in the raster data type.
+
+    """
+
+    points = np.asarray(points,dtype=float).reshape(-1,2)
+    if len(points) == 0:
+        return(np.empty(0,dtype=raster.dtypes[0]))
+
+    rows, cols = rowcol(raster.transform,points[:,0],points[:,1])
+    rows, cols = np.asarray(rows,dtype=np.int64), np.asarray(cols,dtype=np.int64)
+
+    values = np.full(len(rows),raster.nodata or 0,dtype=raster.dtypes[0])
+
+    in_bounds = np.where((rows >= 0) & (cols >= 0) & (rows < raster.height) & (cols < raster.width))[0]
+    block_height, block_width = raster.block_shapes[0]
+    number_of_block_columns = int(np.ceil(raster.width / block_width))
+
+    # group points by the block they fall in
+    block_ids = (rows[in_bounds] // block_height) * number_of_block_columns + (cols[in_bounds] // block_width)
+    block_order = np.argsort(block_ids,kind='stable')
+    block_ids, block_starts = np.unique(block_ids[block_order],return_index=True)
+    block_stops = np.append(block_starts[1:],len(block_order))
+
+    for block_id,start,stop in zip(block_ids,block_starts,block_stops):
+        row_off = (block_id // number_of_block_columns) * block_height
+        col_off = (block_id % number_of_block_columns) * block_width
+        window = Window(col_off,row_off,min(block_width,raster.width-col_off),min(block_height,raster.height-row_off))
+        block = raster.read(1,window=window)
+
+        point_indices = in_bounds[block_order[start:stop]]
+        values[point_indices] = block[rows[point_indices]-row_off,cols[point_indices]-col_off]
+
+    return(values)
+
+
+if __name__ == '__main__':
+
+    flows_fileName         = sys.argv[1] # $outputDataDir/demDerived_reaches.gpkg
+    dem_fileName           = sys.argv[2] # $outputDataDir/dem_thalwegCond.tif
+    split_flows_fileName   = sys.argv[3] # $outputDataDir/demDerived_reaches_split.gpkg
+    split_points_fileName  = sys.argv[4] # $outputDataDir/demDerived_reaches_split_points.gpkg
+    maxLength              = float(sys.argv[5])
+    slope_min              = float(sys.argv[6])
+    huc8_filename          = sys.argv[7] # $outputDataDir/wbd8_projected.gpkg
+    lakes_filename         = sys.argv[8] # $outputDataDir/nwm_lakes_proj_clp.gpkg
+    num_workers            = int(sys.argv[9]) if len(sys.argv) > 9 else 1
+
+    split_flows_gdf, split_points_gdf = split_flows(flows_fileName,dem_fileName,maxLength,slope_min,huc8_filename,lakes_filename,num_workers)
 
-split_points_gdf = gpd.GeoDataFrame({'id': hydroIDs_points , 'geometry':split_points}, crs=flows.crs, geometry='geometry')
-print('Writing outputs ...')
+    print('Writing outputs ...')
 
-if isfile(split_flows_fileName):
-    remove(split_flows_fileName)
-split_flows_gdf.to_file(split_flows_fileName,driver='GPKG',index=False)
+    if isfile(split_flows_fileName):
+        remove(split_flows_fileName)
+    split_flows_gdf.to_file(split_flows_fileName,driver='GPKG',index=False)
 
-if isfile(split_points_fileName):
-    remove(split_points_fileName)
-split_points_gdf.to_file(split_points_fileName,driver='GPKG',index=False)
+    if isfile(split_points_fileName):
+        remove(split_points_fileName)
+    split_points_gdf.to_file(split_points_fileName,driver='GPKG',index=False)
 
 
 # def findIntersectionPoints(flows):
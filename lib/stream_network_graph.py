@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+
+
+class StreamNetworkGraph:
+
+    """
+    Compact stream network graph of line features stored as CSR integer arrays
+
+    ...
+
+    Features are addressed by position (0 to n-1) in the table the graph was built from. An edge goes
+    from a feature to each feature directly downstream of it. Downstream edges of a feature are kept
+    in table order.
+
+    Attributes
+    ----------
+    ids : numpy array
+        feature ids (ie HydroID or NHDPlusID) in table order
+    indptr : numpy array
+        CSR row pointers of downstream edges. Downstream features of position i are indices[indptr[i]:indptr[i+1]]
+    indices : numpy array
+        CSR column indices of downstream edges
+    up_indptr : numpy array
+        CSR row pointers of upstream edges
+    up_indices : numpy array
+        CSR column indices of upstream edges
+    up_edges : numpy array
+        position in indices of each upstream edge
+
+    Methods
+    -------
+    from_nodes(from_nodes,to_nodes,ids=None)
+        Builds graph from FromNode and ToNode columns
+    from_next_down_ids(ids,next_down_ids)
+        Builds graph from id and NextDownID columns
+    positions(ids)
+        Positions of feature ids. -1 where not in graph
+    trace_downstream(start,edge_mask=None)
+        Boolean mask of start features and all features downstream of them
+    upstream_closure(start,edge_mask=None)
+        Boolean mask of start features and all features upstream of them
+    topological_order()
+        Positions ordered from upstream to downstream
+    headwaters()
+        Boolean mask of features without upstream features
+    outlets()
+        Boolean mask of features without downstream features
+    connected_components()
+        Label of the connected (undirected) sub-network of each feature
+    save(fileName)
+        Saves graph to .npz file
+    load(fileName)
+        Loads graph saved to .npz file
+
+    Examples
+    --------
+    >>> graph = StreamNetworkGraph.from_nodes(nhd_streams['FromNode'],nhd_streams['ToNode'],nhd_streams['NHDPlusID'])
+    >>> is_downstream = graph.trace_downstream(nhd_streams['is_nwm_headwater'].values)
+
+    """
+
+    def __init__(self,ids,indptr,indices):
+
+        self.ids = np.asarray(ids)
+        self.indptr = np.asarray(indptr,dtype=np.int64)
+        self.indices = np.asarray(indices,dtype=np.int64)
+
+        if len(self.indptr) != len(self.ids) + 1:
+            raise ValueError('indptr must have one more element than ids')
+
+        # reverse edges. stable sort keeps upstream features in table order
+        sources = np.repeat(np.arange(len(self.ids),dtype=np.int64),np.diff(self.indptr))
+        self.up_edges = np.argsort(self.indices,kind='stable')
+        self.up_indices = sources[self.up_edges]
+        self.up_indptr = np.concatenate(([0],np.cumsum(np.bincount(self.indices,minlength=len(self.ids))))).astype(np.int64)
+
+
+    @classmethod
+    def from_nodes(cls,from_nodes,to_nodes,ids=None):
+
+        """
+        Builds graph from node columns. Feature j is downstream of feature i where from_nodes[j] == to_nodes[i]
+
+        ...
+
+        Parameters
+        ----------
+        from_nodes : array-like
+            upstream node of each feature
+        to_nodes : array-like
+            downstream node of each feature
+        ids : array-like, optional
+            feature ids. Defaults to positions
+
+        Returns
+        -------
+        StreamNetworkGraph
+
+        """
+
+        from_nodes = np.asarray(from_nodes) ; to_nodes = np.asarray(to_nodes)
+        nfeatures = len(from_nodes)
+
+        if ids is None:
+            ids = np.arange(nfeatures,dtype=np.int64)
+
+        # features grouped by from node code, in table order within each group
+        from_codes, uniques = pd.factorize(from_nodes)
+        to_codes = pd.Index(uniques).get_indexer(to_nodes)
+        has_from = from_codes >= 0
+        by_from_node = np.flatnonzero(has_from)[np.argsort(from_codes[has_from],kind='stable')]
+        group_sizes = np.bincount(from_codes[has_from],minlength=len(uniques))
+        group_starts = np.concatenate(([0],np.cumsum(group_sizes)[:-1])).astype(np.int64)
+
+        # each feature links to the from node group matching its to node
+        has_downstream = to_codes >= 0
+        counts = np.zeros(nfeatures,dtype=np.int64)
+        counts[has_downstream] = group_sizes[to_codes[has_downstream]]
+        starts = np.zeros(nfeatures,dtype=np.int64)
+        starts[has_downstream] = group_starts[to_codes[has_downstream]]
+
+        indptr = np.concatenate(([0],np.cumsum(counts))).astype(np.int64)
+        indices = by_from_node[_ranges(starts,counts)]
+
+        return(cls(ids,indptr,indices))
+
+
+    @classmethod
+    def from_next_down_ids(cls,ids,next_down_ids):
+
+        """
+        Builds graph from NextDownID column. Ids without a matching feature (ie -1) are outlets
+
+        ...
+
+        Parameters
+        ----------
+        ids : array-like
+            feature ids
+        next_down_ids : array-like
+            id of downstream feature of each feature
+
+        Returns
+        -------
+        StreamNetworkGraph
+
+        """
+
+        ids = np.asarray(ids)
+
+        # duplicate ids resolve to their first feature
+        first_positions = np.flatnonzero(~pd.Index(ids).duplicated(keep='first'))
+        downstream = pd.Index(ids[first_positions]).get_indexer(np.asarray(next_down_ids))
+        downstream = np.where(downstream >= 0,first_positions[np.maximum(downstream,0)],-1)
+
+        has_downstream = downstream >= 0
+        indptr = np.concatenate(([0],np.cumsum(has_downstream))).astype(np.int64)
+        indices = downstream[has_downstream]
+
+        return(cls(ids,indptr,indices))
+
+
+    def __len__(self):
+        return(len(self.ids))
+
+
+    def positions(self,ids):
+        """ Positions of feature ids. -1 where not in graph """
+
+        return(pd.Index(self.ids).get_indexer(np.asarray(ids)))
+
+
+    def trace_downstream(self,start,edge_mask=None):
+
+        """
+        Boolean mask of start features and all features downstream of them
+
+        ...
+
+        Parameters
+        ----------
+        start : array-like
+            boolean mask or positions of starting features
+        edge_mask : numpy array, optional
+            boolean mask aligned with indices. Edges set to False are not followed
+
+        Returns
+        -------
+        numpy array
+            boolean mask of reached features
+
+        """
+
+        return(_traverse(self.indptr,self.indices,self._start_positions(start),edge_mask,len(self)))
+
+
+    def upstream_closure(self,start,edge_mask=None):
+
+        """
+        Boolean mask of start features and all features upstream of them
+
+        ...
+
+        Parameters
+        ----------
+        start : array-like
+            boolean mask or positions of starting features
+        edge_mask : numpy array, optional
+            boolean mask aligned with indices (downstream edges). Edges set to False are not followed
+
+        Returns
+        -------
+        numpy array
+            boolean mask of reached features
+
+        """
+
+        if edge_mask is not None:
+            edge_mask = np.asarray(edge_mask,dtype=bool)[self.up_edges]
+
+        return(_traverse(self.up_indptr,self.up_indices,self._start_positions(start),edge_mask,len(self)))
+
+
+    def topological_order(self,break_cycles=False):
+
+        """
+        Positions ordered from upstream to downstream, one level of features at a time
+
+        ...
+
+        Parameters
+        ----------
+        break_cycles : bool
+            Order features on or below cycles after all other features, in position order, instead of raising
+
+        Returns
+        -------
+        numpy array
+            positions of all features
+
+        Raises
+        ------
+        ValueError
+            If network has a cycle and break_cycles is False
+
+        """
+
+        in_degree = np.diff(self.up_indptr).copy()
+        frontier = np.flatnonzero(in_degree == 0)
+        order = []
+
+        while len(frontier) > 0:
+            order.append(frontier)
+            downstream = self.indices[_ranges(self.indptr[frontier],np.diff(self.indptr)[frontier])]
+            in_degree -= np.bincount(downstream,minlength=len(self))
+            candidates = np.unique(downstream)
+            frontier = candidates[in_degree[candidates] == 0]
+
+        order = np.concatenate(order) if order else np.zeros(0,dtype=np.int64)
+
+        if len(order) != len(self):
+            if not break_cycles:
+                raise ValueError('Stream network has a cycle')
+
+            unordered = np.ones(len(self),dtype=bool)
+            unordered[order] = False
+            order = np.concatenate((order,np.flatnonzero(unordered)))
+
+        return(order)
+
+
+    def headwaters(self):
+        """ Boolean mask of features without upstream features """
+
+        return(np.diff(self.up_indptr) == 0)
+
+
+    def outlets(self):
+        """ Boolean mask of features without downstream features """
+
+        return(np.diff(self.indptr) == 0)
+
+
+    def connected_components(self):
+
+        """
+        Label of the connected sub-network of each feature, ignoring flow direction
+
+        ...
+
+        Returns
+        -------
+        numpy array
+            component labels numbered from 0 in order of first feature
+
+        """
+
+        labels = np.arange(len(self),dtype=np.int64)
+        sources = np.repeat(labels,np.diff(self.indptr))
+        targets = self.indices
+
+        # min label propagation along edges with pointer jumping
+        while True:
+            previous = labels.copy()
+            edge_labels = np.minimum(labels[sources],labels[targets])
+            np.minimum.at(labels,sources,edge_labels)
+            np.minimum.at(labels,targets,edge_labels)
+            labels = labels[labels]
+            if np.array_equal(labels,previous):
+                break
+
+        return(pd.factorize(labels)[0])
+
+
+    def save(self,fileName):
+        """ Saves graph to .npz file """
+
+        np.savez(fileName,ids=self.ids,indptr=self.indptr,indices=self.indices)
+
+
+    @classmethod
+    def load(cls,fileName):
+        """ Loads graph saved to .npz file """
+
+        with np.load(fileName,allow_pickle=False) as data:
+            return(cls(data['ids'],data['indptr'],data['indices']))
+
+
+    def _start_positions(self,start):
+
+        start = np.asarray(start)
+
+        if start.dtype == bool:
+            return(np.flatnonzero(start))
+
+        return(start.astype(np.int64))
+
+
+def _ranges(starts,counts):
+    """ Concatenated ranges [starts[i],starts[i]+counts[i]) as one array """
+
+    counts = np.asarray(counts,dtype=np.int64)
+    total = counts.sum()
+    if total == 0:
+        return(np.zeros(0,dtype=np.int64))
+
+    offsets = np.repeat(np.cumsum(counts) - counts,counts)
+    return(np.repeat(np.asarray(starts,dtype=np.int64),counts) + np.arange(total,dtype=np.int64) - offsets)
+
+
+def _traverse(indptr,indices,start,edge_mask,nfeatures):
+    """ Breadth first traversal of CSR graph, one frontier at a time """
+
+    visited = np.zeros(nfeatures,dtype=bool)
+    visited[start] = True
+    frontier = np.unique(start)
+
+    while len(frontier) > 0:
+        edges = _ranges(indptr[frontier],indptr[frontier+1] - indptr[frontier])
+        if edge_mask is not None:
+            edges = edges[edge_mask[edges]]
+        neighbours = np.unique(indices[edges])
+        frontier = neighbours[~visited[neighbours]]
+        visited[frontier] = True
+
+    return(visited)
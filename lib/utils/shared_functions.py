@@ -1,6 +1,13 @@
 #!/usr/bin/env python3
 
 import os
+import json
+import hashlib
+import threading
+import urllib.request
+from urllib.error import HTTPError
+import numpy as np
+import pandas as pd
 
 
 def pull_file(url, full_pulled_filepath):
@@ -11,11 +18,154 @@ def pull_file(url, full_pulled_filepath):
         url (str): The full URL to the file to download.
         full_pulled_filepath (str): The full system path where the downloaded file will be saved.
     """
-    import urllib.request
-    
     print("Pulling " + url)
     urllib.request.urlretrieve(url, full_pulled_filepath)
 
+
+class DownloadManifest:
+    """
+    JSON record of pulled files keyed by system path. Records hold the URL, the ETag and Last-Modified validators of the
+    response, the size, whether the pull completed and the SHA-256 of completed pulls. Safe to share between threads.
+
+    Args:
+        manifest_filepath (str): The full system path of the JSON manifest. Loaded if it exists.
+    """
+
+    def __init__(self, manifest_filepath):
+        self.manifest_filepath = manifest_filepath
+        self._lock = threading.Lock()
+
+        if os.path.isfile(manifest_filepath):
+            with open(manifest_filepath) as f:
+                self.records = json.load(f)
+        else:
+            self.records = {}
+
+    def get(self, full_pulled_filepath):
+        with self._lock:
+            record = self.records.get(full_pulled_filepath)
+            return(None if record is None else dict(record))
+
+    def update(self, full_pulled_filepath, **fields):
+        with self._lock:
+            self.records.setdefault(full_pulled_filepath, {}).update(fields)
+            self._write()
+
+    def remove(self, full_pulled_filepath):
+        with self._lock:
+            if self.records.pop(full_pulled_filepath, None) is not None:
+                self._write()
+
+    def _write(self):
+        # replace so a crash never leaves a truncated manifest
+        temp_filepath = self.manifest_filepath + '.tmp'
+        with open(temp_filepath, 'w') as f:
+            json.dump(self.records, f, indent=2, sort_keys=True)
+        os.replace(temp_filepath, self.manifest_filepath)
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """
+    This helper function returns the hex SHA-256 digest of a file.
+
+    Args:
+        file_path (str): System path to the file.
+        chunk_size (int): Bytes read at a time.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return(digest.hexdigest())
+
+
+def pull_file_resumable(url, full_pulled_filepath, manifest=None, overwrite=False, chunk_size=1 << 20):
+    """
+    This helper function pulls a file to a specified path, resuming interrupted pulls with HTTP Range requests.
+    Data is streamed to full_pulled_filepath + '.part' and moved into place once complete. With a manifest,
+    completed files whose size and SHA-256 match their record are not pulled again and partial files are only
+    resumed if the server's ETag or Last-Modified still matches (If-Range), otherwise the pull restarts.
+
+    Args:
+        url (str): The full URL to the file to download.
+        full_pulled_filepath (str): The full system path where the downloaded file will be saved.
+        manifest (DownloadManifest): Records of pulled files. Without one, existing partial files are discarded.
+        overwrite (bool): Discard existing complete and partial files and pull again.
+        chunk_size (int): Bytes read at a time.
+    """
+    part_filepath = full_pulled_filepath + '.part'
+    record = None if manifest is None else manifest.get(full_pulled_filepath)
+
+    if overwrite:
+        delete_file(full_pulled_filepath)
+        delete_file(part_filepath)
+        record = None
+
+    # Keep complete pulls that match their record.
+    if (record is not None) and record.get('complete') and os.path.isfile(full_pulled_filepath):
+        if (os.path.getsize(full_pulled_filepath) == record.get('size')) and (file_sha256(full_pulled_filepath) == record.get('sha256')):
+            print("Already pulled " + url)
+            return
+
+    # Resume partial pulls only if they can be validated against the server's copy.
+    offset = os.path.getsize(part_filepath) if os.path.isfile(part_filepath) else 0
+    validator = None if record is None else (record.get('etag') or record.get('last_modified'))
+    headers = {}
+    if offset and (validator is not None) and (record.get('url') == url):
+        headers['Range'] = 'bytes={}-'.format(offset)
+        headers['If-Range'] = validator
+    else:
+        offset = 0
+
+    print("Pulling " + url + (" from byte {}".format(offset) if offset else ""))
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+    except HTTPError as e:
+        if (e.code == 416) and offset:  # Partial file is not a prefix of the server's copy. Start over.
+            delete_file(part_filepath)
+            if manifest is not None:
+                manifest.remove(full_pulled_filepath)
+            return(pull_file_resumable(url, full_pulled_filepath, manifest, False, chunk_size))
+        raise
+
+    with response:
+        digest = hashlib.sha256()
+        if response.status == 206:
+            content_range = response.headers.get('Content-Range', '')
+            if not content_range.startswith('bytes {}-'.format(offset)):
+                raise IOError("Unexpected Content-Range '{}' resuming {}".format(content_range, url))
+            # Hash what was already pulled.
+            with open(part_filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    digest.update(chunk)
+            mode = 'ab'
+        else:  # Full response. The server's copy changed or ranges are not supported.
+            offset, mode = 0, 'wb'
+
+        content_length = response.headers.get('Content-Length')
+        size = None if content_length is None else offset + int(content_length)
+
+        # Record validators before streaming so an interrupted pull can be resumed.
+        if manifest is not None:
+            manifest.update(full_pulled_filepath, url=url, etag=response.headers.get('ETag'),
+                            last_modified=response.headers.get('Last-Modified'), size=size, complete=False, sha256=None)
+
+        with open(part_filepath, mode) as f:
+            for chunk in iter(lambda: response.read(chunk_size), b''):
+                f.write(chunk)
+                digest.update(chunk)
+
+    pulled_size = os.path.getsize(part_filepath)
+    if (size is not None) and (pulled_size != size):
+        raise IOError("Incomplete pull of {}: {} of {} bytes".format(url, pulled_size, size))
+
+    os.replace(part_filepath, full_pulled_filepath)
+
+    if manifest is not None:
+        manifest.update(full_pulled_filepath, size=pulled_size, complete=True, sha256=digest.hexdigest())
+
         
 def delete_file(file_path):
     """
@@ -47,6 +197,59 @@ def run_system_command(args):
     os.system(command)
     
     
+def write_typed_table(table, parquet_filepath, dtypes):
+    """
+    This helper function writes a table to Parquet with a fixed schema so that typed outputs concatenate and load without parsing.
+    
+    Args:
+        table (pandas.DataFrame): Table to write.
+        parquet_filepath (str): The full system path where the Parquet file will be saved.
+        dtypes (dict): Column name to data type. Columns not in dtypes are written as float64. 'string' columns are nullable.
+    """
+    
+    table = table.copy()
+    for column in table.columns:
+        dtype = dtypes.get(column, 'float64')
+        if dtype == 'string':
+            # nullable strings keep missing values null instead of writing the text 'nan'
+            values = table[column]
+            if pd.api.types.is_float_dtype(values):  # integer codes read with missing values
+                values = values.astype('Int64')
+            table[column] = values.where(values.isna(), values.astype(str)).astype('string')
+        else:
+            table[column] = table[column].astype(dtype)
+    table.to_parquet(parquet_filepath, engine='pyarrow', index=False)
+
+
+def write_src_json(src_table, src_json_filepath):
+    """
+    This helper function writes the stage and discharge lists of every HydroID in an SRC table to JSON, in the layout of
+    json.dump with sort_keys=True and indent=2. One stable sort by HydroID splits the table so lists keep table order,
+    and the file is written one HydroID at a time.
+    
+    Args:
+        src_table (pandas.DataFrame): SRC table with HydroID, Stage and Discharge (m3s-1) columns.
+        src_json_filepath (str): The full system path where the JSON file will be saved.
+    """
+    
+    src_order = src_table['HydroID'].values.argsort(kind='mergesort')
+    src_hydroIDs = src_table['HydroID'].values[src_order]
+    src_stages = src_table['Stage'].values.astype(float)[src_order]
+    src_discharges = src_table['Discharge (m3s-1)'].values.astype(float)[src_order]
+    hydroID_list, hid_starts = np.unique(src_hydroIDs, return_index=True)
+    hid_ends = np.append(hid_starts[1:], len(src_hydroIDs))
+    
+    # keys are sorted as strings like sort_keys
+    hid_keys = hydroID_list.astype(str)
+    with open(src_json_filepath, 'w') as f:
+        f.write('{')
+        for i, k in enumerate(np.argsort(hid_keys, kind='mergesort')):
+            hid_json = json.dumps({ 'q_list' : src_discharges[hid_starts[k]:hid_ends[k]].tolist() ,
+                                    'stage_list' : src_stages[hid_starts[k]:hid_ends[k]].tolist() }, indent=2)
+            f.write('{}\n  {}: {}'.format(',' if i > 0 else '', json.dumps(hid_keys[k]), hid_json.replace('\n', '\n  ')))
+        f.write('\n}' if len(hid_keys) > 0 else '}')
+
+
 def subset_wbd_gpkg(wbd_gpkg, multilayer_wbd_geopackage):
     
     import geopandas as gp
@@ -23,6 +23,11 @@ NHD_VECTOR_EXTRACTION_SUFFIX = '_HU4_GDB.zip'
 # -- Field Names -- #
 FOSS_ID = 'fossid'
 
+# -- Typed Table Schemas -- #
+HYDRO_TABLE_DTYPES = {'HydroID' : 'int64', 'feature_id' : 'int64', 'stage' : 'float64', 'discharge_cms' : 'float64', 'HUC' : 'string', 'LakeID' : 'int64'}
+CROSSWALK_TABLE_DTYPES = {'HydroID' : 'int64', 'feature_id' : 'int64'}
+SRC_TABLE_DTYPES = {'HydroID' : 'int64', 'feature_id' : 'int64'}  # remaining SRC columns are float64
+
 # -- Other -- #
 CONUS_STATE_LIST = {"AL", "AZ", "AR", "CA", "CO", "CT", "DC", "DE", "FL", "GA", 
                     "HI", "ID", "IL", "IN", "IA", "KS", "KY", "LA", "ME", "MD", 
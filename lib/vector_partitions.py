@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import fiona
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+from os.path import isdir, isfile, join, dirname
+from itertools import islice
+from collections import OrderedDict
+
+HUC4_INDEX_FILENAME = 'huc4_index.gpkg'
+NATIONAL_INDEX = 'national_index'
+PARTITION_CHUNK_SIZE = 250000
+
+# columns kept in each partitioned layer. columns missing from the national layer are skipped
+PARTITION_COLUMNS = { 'nwm_flows' : ['ID','feature_id','order_'],
+                      'nwm_headwaters' : [],
+                      'nwm_catchments' : ['ID'],
+                      'nwm_lakes' : ['newID'],
+                      'nhd_burnlines' : ['NHDPlusID','ReachCode','FromNode','ToNode','StreamOrde','DnLevelPat','LevelPathI'] }
+
+
+def partition_vector_layers(layers,wbd_fileName,partitions_dir,chunk_size=PARTITION_CHUNK_SIZE):
+
+    """
+        Writes national vector layers to a HUC4 partitioned store. Each layer gets a directory with one GeoPackage per HUC4
+        holding the features intersecting that HUC4. Features crossing HUC4 boundaries are written to each partition and carry
+        their national row number so reads across partitions can drop them.
+
+        National layers are streamed in chunks of features with only the partition columns read, so memory is bounded by
+        chunk_size rather than the size of the national layer. Partition files stay open and are appended to chunk by chunk.
+
+        Parameters
+        ----------
+        layers : dict
+            Layer name to file name of national layer. Layer names are keys of PARTITION_COLUMNS.
+        wbd_fileName : str
+            File name of national WBD GeoPackage with WBDHU4 layer.
+        partitions_dir : str
+            Directory of partitioned store.
+        chunk_size : int
+            Number of features read at a time.
+
+    """
+
+    if not isdir(partitions_dir):
+        os.makedirs(partitions_dir)
+
+    huc4s = gpd.read_file(wbd_fileName,layer='WBDHU4')
+    huc4s = huc4s.filter(items=['HUC4','geometry'])
+    huc4s.to_file(join(partitions_dir,HUC4_INDEX_FILENAME),driver='GPKG',index=False)
+    huc4_codes = huc4s['HUC4'].values
+
+    for layer_name,layer_fileName in layers.items():
+
+        if not isfile(layer_fileName):
+            print("Missing {} for partitioning: {}".format(layer_name,layer_fileName),flush=True)
+            continue
+
+        print("Partitioning {} by HUC4".format(layer_name),flush=True)
+
+        layer_dir = join(partitions_dir,layer_name)
+        if not isdir(layer_dir):
+            os.makedirs(layer_dir)
+        for partition_fileName in os.listdir(layer_dir):
+            if partition_fileName.endswith('.gpkg'):
+                os.remove(join(layer_dir,partition_fileName))
+
+        partitions = dict()
+        try:
+            with fiona.open(layer_fileName) as source:
+
+                # partition schema is fixed from the national layer so every chunk is written with the same field types
+                source_properties = source.schema['properties']
+                columns = [ c for c in PARTITION_COLUMNS[layer_name] if c in source_properties ]
+                schema = { 'geometry' : source.schema['geometry'],
+                           'properties' : OrderedDict([ (c,source_properties[c]) for c in columns ] + [ (NATIONAL_INDEX,'int') ]) }
+                source_crs = source.crs_wkt
+
+            with fiona.open(layer_fileName,ignore_fields=[ c for c in source_properties if c not in columns ]) as source:
+
+                features = iter(source)
+                chunk_start = 0
+                while True:
+                    chunk = gpd.GeoDataFrame.from_features(list(islice(features,chunk_size)),crs=source_crs,columns=columns + ['geometry'])
+                    if len(chunk) == 0:
+                        break
+
+                    chunk[NATIONAL_INDEX] = np.arange(chunk_start,chunk_start + len(chunk),dtype=np.int64)
+                    chunk_start += len(chunk)
+                    chunk = chunk.to_crs(huc4s.crs)
+
+                    # one bulk spatial index query of all HUC4s against the chunk, grouped by HUC4 with one sort
+                    huc4_positions, feature_positions = chunk.sindex.query_bulk(huc4s.geometry,predicate='intersects')
+                    order = np.lexsort((feature_positions,huc4_positions))
+                    huc4_positions, feature_positions = huc4_positions[order], feature_positions[order]
+                    chunk_huc4_positions, group_starts = np.unique(huc4_positions,return_index=True)
+                    group_stops = np.append(group_starts[1:],len(huc4_positions))
+
+                    for huc4_position,group_start,group_stop in zip(chunk_huc4_positions,group_starts,group_stops):
+                        huc4 = huc4_codes[huc4_position]
+                        if huc4 not in partitions:
+                            partitions[huc4] = fiona.open(join(layer_dir,huc4 + '.gpkg'),'w',driver='GPKG',layer=huc4,
+                                                          schema=schema,crs_wkt=huc4s.crs.to_wkt())
+                        partitions[huc4].writerecords(chunk.iloc[feature_positions[group_start:group_stop]].iterfeatures())
+        finally:
+            for partition in partitions.values():
+                partition.close()
+
+
+def read_vector_layer(fileName,mask=None):
+
+    """
+        Reads a vector layer from a file or from a layer directory of the HUC4 partitioned store.
+        Only partitions overlapping mask are read.
+    """
+
+    if not isdir(fileName):
+        return(gpd.read_file(fileName,mask=mask))
+
+    huc4s = gpd.read_file(join(dirname(fileName.rstrip('/')),HUC4_INDEX_FILENAME),mask=mask)
+    partition_fileNames = [ join(fileName,huc4 + '.gpkg') for huc4 in huc4s['HUC4'] ]
+    partitions = [ gpd.read_file(f,mask=mask) for f in partition_fileNames if isfile(f) ]
+
+    if len(partitions) == 0:
+        # empty layer with the partition schema
+        partition_fileNames = sorted(f for f in os.listdir(fileName) if f.endswith('.gpkg'))
+        partitions = [ gpd.read_file(join(fileName,partition_fileNames[0]),mask=mask) ]
+
+    layer = pd.concat(partitions,ignore_index=True)
+    layer = layer.drop_duplicates(subset=NATIONAL_INDEX).sort_values(NATIONAL_INDEX)
+    layer = gpd.GeoDataFrame(layer.drop(columns=[NATIONAL_INDEX]),crs=partitions[0].crs,geometry='geometry').reset_index(drop=True)
+
+    return(layer)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Partition national vector layers by HUC4')
+    parser.add_argument('-u','--wbd',help='National WBD GeoPackage with WBDHU4 layer',required=True)
+    parser.add_argument('-o','--partitions-dir',help='Output directory of partitioned store',required=True)
+    parser.add_argument('-w','--nwm-flows',help='NWM flowlines',required=False,default=None)
+    parser.add_argument('-f','--nwm-headwaters',help='NWM headwater points',required=False,default=None)
+    parser.add_argument('-m','--nwm-catchments',help='NWM catchments',required=False,default=None)
+    parser.add_argument('-l','--nwm-lakes',help='NWM lakes',required=False,default=None)
+    parser.add_argument('-s','--nhd-burnlines',help='Aggregate NHDPlus HR burnlines',required=False,default=None)
+
+    args = vars(parser.parse_args())
+
+    layers = { layer_name : args[layer_name] for layer_name in PARTITION_COLUMNS if args[layer_name] is not None }
+
+    partition_vector_layers(layers,args['wbd'],args['partitions_dir'])
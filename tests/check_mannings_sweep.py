@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# lib/utils, not tests/utils
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from mannings_sweep import mannings_sweep
+
+
+def check_mannings_sweep():
+
+    mannings_tables = {'n_0.04' : {str(order) : 0.04 for order in range(1,15)},
+                       'n_gaps' : {'1' : 0.05, '3' : 0.07, '14' : 0.09}}
+
+    # orders above and below the tables, zero and a HydroID without an order
+    stream_orders = pd.Series([1,2,3,14,15,-1,0],index=[101,102,103,104,105,106,107],name='order_')
+    hydroids = np.array([101,102,103,104,105,106,107,108,101,106])
+
+    rng = np.random.default_rng(0)
+    src_table = pd.DataFrame({'HydroID' : hydroids,
+                              'Stage' : [0.5,1,1,1,1,1,1,1,0,1],
+                              'WetArea (m2)' : rng.uniform(1,100,len(hydroids)),
+                              'HydraulicRadius (m)' : rng.uniform(0.1,5,len(hydroids)),
+                              'SLOPE' : rng.uniform(0.0001,0.01,len(hydroids))})
+
+    discharges = mannings_sweep(src_table,stream_orders,mannings_tables)
+
+    # single table mapping of add_crosswalk.py
+    hydraulic_term = src_table['WetArea (m2)'] * pow(src_table['HydraulicRadius (m)'],2.0/3) * pow(src_table['SLOPE'],0.5)
+    for i, table in enumerate(mannings_tables.values()):
+        n = stream_orders.astype(str).map(table).reindex(hydroids).values
+        expected = (hydraulic_term / n).values
+        expected[src_table['Stage'].values == 0] = 0
+        np.testing.assert_array_equal(np.isnan(discharges[i]),np.isnan(expected))
+        np.testing.assert_allclose(discharges[i],expected)
+
+    # out of range and negative orders give nan, not an error or a wrapped column
+    assert np.isnan(discharges[:,[4,5,6,7,9]]).all()
+    print("Manning's n sweep matches the single table mapping")
+
+
+if __name__ == '__main__':
+
+    check_mannings_sweep()
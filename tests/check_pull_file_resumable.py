@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# lib/utils, not tests/utils
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from utils.shared_functions import DownloadManifest, pull_file_resumable, file_sha256
+
+DATA = os.urandom(300000)
+ETAG = '"check-etag"'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    Serves DATA with ETag, Range and If-Range support. Set cut_after to drop the connection after that many
+    body bytes of the next response.
+    """
+
+    cut_after = None
+    requests = []
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        RangeHandler.requests.append(range_header)
+
+        start = 0
+        if (range_header is not None) and (if_range in (None, ETAG)):
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(DATA):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(len(DATA)))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(DATA) - 1, len(DATA)))
+        else:
+            self.send_response(200)
+
+        body = DATA[start:]
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if RangeHandler.cut_after is not None:
+            body = body[:RangeHandler.cut_after]
+            RangeHandler.cut_after = None
+            self.wfile.write(body)
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def check_pull_file_resumable():
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/data.bin'.format(server.server_address[1])
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        pulled_filepath = os.path.join(work_dir, 'data.bin')
+        part_filepath = pulled_filepath + '.part'
+        manifest = DownloadManifest(os.path.join(work_dir, 'manifest.json'))
+
+        # Interrupted pull leaves a partial file and an incomplete record.
+        RangeHandler.cut_after = 100000
+        try:
+            pull_file_resumable(url, pulled_filepath, manifest, chunk_size=8192)
+        except Exception:
+            pass
+        else:
+            raise AssertionError("Interrupted pull did not fail")
+        assert not os.path.isfile(pulled_filepath)
+        assert os.path.getsize(part_filepath) == 100000
+        assert manifest.get(pulled_filepath)['complete'] is False
+        print("Interrupted pull kept {} bytes".format(os.path.getsize(part_filepath)))
+
+        # Resume from the partial file with a Range request.
+        RangeHandler.requests = []
+        pull_file_resumable(url, pulled_filepath, DownloadManifest(manifest.manifest_filepath), chunk_size=8192)
+        assert RangeHandler.requests == ['bytes=100000-']
+        with open(pulled_filepath, 'rb') as f:
+            assert f.read() == DATA
+        assert not os.path.isfile(part_filepath)
+        record = DownloadManifest(manifest.manifest_filepath).get(pulled_filepath)
+        assert record['complete'] and (record['size'] == len(DATA)) and (record['sha256'] == file_sha256(pulled_filepath))
+        print("Resumed pull matches")
+
+        # Complete pulls matching their record are skipped.
+        RangeHandler.requests = []
+        pull_file_resumable(url, pulled_filepath, DownloadManifest(manifest.manifest_filepath))
+        assert RangeHandler.requests == []
+        print("Complete pull skipped")
+
+        # A partial file longer than the server's copy gets a 416 and the pull restarts.
+        os.remove(pulled_filepath)
+        with open(part_filepath, 'wb') as f:
+            f.write(DATA + b'extra')
+        manifest = DownloadManifest(manifest.manifest_filepath)
+        manifest.update(pulled_filepath, complete=False, sha256=None)
+        RangeHandler.requests = []
+        pull_file_resumable(url, pulled_filepath, manifest, chunk_size=8192)
+        assert RangeHandler.requests == ['bytes={}-'.format(len(DATA) + 5), None]
+        with open(pulled_filepath, 'rb') as f:
+            assert f.read() == DATA
+        assert manifest.get(pulled_filepath)['complete']
+        print("416 restarted pull matches")
+
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir)
+
+    print("All pull_file_resumable checks passed")
+
+
+if __name__ == '__main__':
+
+    check_pull_file_resumable()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+from collections import deque
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import LineString
+
+# lib/utils, not tests/utils
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from snap_and_clip_to_nhd import trace_nwm_streams, dissolve_links
+
+
+def trace_nwm_streams_by_bfs(nhd_streams):
+    """ is_nwm_stream as snap_and_clip_to_nhd.py traced it before the stream graph, scanning FromNode for every stream """
+
+    nhd_streams = nhd_streams.set_index('NHDPlusID', drop=False)
+    nhd_streams['is_nwm_stream'] = nhd_streams['is_nwm_headwater'].copy()
+
+    Q = deque(nhd_streams.loc[nhd_streams['is_nwm_headwater'], 'NHDPlusID'].tolist())
+    visited = set()
+
+    while Q:
+        q = Q.popleft()
+        if q in visited:
+            continue
+        visited.add(q)
+        toNode, DnLevelPat = nhd_streams.loc[q, ['ToNode', 'DnLevelPat']]
+        try:
+            downstream_ids = nhd_streams.loc[nhd_streams['FromNode'] == toNode, :].index.tolist()
+        except ValueError: # 18050002 has duplicate nhd stream feature
+            if len(toNode.unique()) == 1:
+                toNode = toNode.iloc[0]
+                downstream_ids = nhd_streams.loc[nhd_streams['FromNode'] == toNode, :].index.tolist()
+        if len(downstream_ids) > 1:
+            relevant_ids = [segment for segment in downstream_ids if DnLevelPat == nhd_streams.loc[segment, 'LevelPathI']]
+        else:
+            relevant_ids = downstream_ids
+        nhd_streams.loc[relevant_ids, 'is_nwm_stream'] = True
+        for i in relevant_ids:
+            if i not in visited:
+                Q.append(i)
+
+    return(nhd_streams['is_nwm_stream'].values)
+
+
+def check_trace_nwm_streams():
+
+    rng = np.random.default_rng(4)
+    for trial in range(300):
+        number_of_streams, number_of_nodes = rng.integers(1, 80), rng.integers(2, 50)
+        nhd_streams = pd.DataFrame({'NHDPlusID' : np.arange(number_of_streams) + 1e13,
+                                    'FromNode' : rng.integers(0, number_of_nodes, number_of_streams).astype(float),
+                                    'ToNode' : rng.integers(0, number_of_nodes, number_of_streams).astype(float),
+                                    'LevelPathI' : rng.integers(0, 5, number_of_streams).astype(float),
+                                    'DnLevelPat' : rng.integers(0, 5, number_of_streams).astype(float),
+                                    'is_nwm_headwater' : rng.random(number_of_streams) < 0.2})
+
+        assert (trace_nwm_streams(nhd_streams) == trace_nwm_streams_by_bfs(nhd_streams)).all(), trial
+
+    # a duplicated feature is marked with its copy. the previous trace fails on this since the duplicates are two downstream ids
+    nhd_streams = pd.DataFrame({'NHDPlusID' : [1.0, 2.0, 2.0, 3.0, 4.0],
+                                'FromNode' : [1.0, 2.0, 2.0, 3.0, 5.0],
+                                'ToNode' : [2.0, 3.0, 3.0, 4.0, 6.0],
+                                'LevelPathI' : [1.0] * 5,
+                                'DnLevelPat' : [1.0] * 5,
+                                'is_nwm_headwater' : [True, False, False, False, False]})
+    is_nwm_stream = trace_nwm_streams(nhd_streams)
+    assert is_nwm_stream.tolist() == [True, True, True, True, False]
+
+    print("NWM streams match the previous trace on {} networks".format(trial + 1))
+
+
+def dissolve_links_by_bfs(nhd_streams):
+    """
+    Links as snap_and_clip_to_nhd.py dissolved them before the stream graph. Returns the link geometries by link number
+    and the link numbers streams end up with. A stream below a confluence is queued once per upstream stream and each
+    time gets a new link, leaving the earlier ones orphaned.
+    """
+
+    nhd_streams = nhd_streams.set_index('NHDPlusID', drop=False)
+    nhd_streams['before_confluence'] = nhd_streams.duplicated(subset='ToNode', keep=False)
+    nhd_streams.loc[nhd_streams['is_nwm_headwater'], 'linkNo'] = np.arange(1, nhd_streams['is_nwm_headwater'].sum() + 1)
+
+    Q = deque(nhd_streams.loc[nhd_streams['is_nwm_headwater'], 'NHDPlusID'].tolist())
+    visited = set()
+    linkNo = np.max(nhd_streams.loc[nhd_streams['is_nwm_headwater'], 'linkNo']) + 1
+    link_geometries = dict()
+
+    for q in Q:
+        link_geometries[nhd_streams.loc[q, 'linkNo']] = [p for p in zip(*nhd_streams.loc[q, 'geometry'].coords.xy)][::-1]
+
+    while Q:
+        q = Q.popleft()
+        if q in visited:
+            continue
+        visited.add(q)
+
+        downstream_ids = nhd_streams.loc[nhd_streams['FromNode'] == nhd_streams.loc[q, 'ToNode'], :].index.tolist()
+        for i in downstream_ids:
+            if i not in visited:
+                Q.append(i)
+                next_stream_geometry = [p for p in zip(*nhd_streams.loc[i, 'geometry'].coords.xy)][::-1]
+                if nhd_streams.loc[q, 'before_confluence'] or (len(downstream_ids) > 1):
+                    linkNo += 1
+                    nhd_streams.loc[i, 'linkNo'] = linkNo
+                    link_geometries[linkNo] = next_stream_geometry
+                else:
+                    nhd_streams.loc[i, 'linkNo'] = nhd_streams.loc[q, 'linkNo']
+                    link_geometries[nhd_streams.loc[i, 'linkNo']] = link_geometries[nhd_streams.loc[i, 'linkNo']] + next_stream_geometry
+
+    link_geometries = {link_number : LineString(coordinates) for link_number, coordinates in link_geometries.items()}
+
+    return(link_geometries, nhd_streams['linkNo'].dropna().unique())
+
+
+def random_stream_tree(rng):
+    """ Streams of a random tree, each node flows to its parent node. Streams are shuffled so table order is not flow order """
+
+    number_of_nodes = rng.integers(3, 30)
+    parents = [-1] + [rng.integers(0, node) for node in range(1, number_of_nodes)]
+    positions = rng.uniform(0, 100, (number_of_nodes, 2))
+
+    streams = gpd.GeoDataFrame({'FromNode' : np.arange(1, number_of_nodes, dtype=float),
+                                'ToNode' : np.array(parents[1:], dtype=float),
+                                'geometry' : [LineString([positions[node], (positions[node] + positions[parents[node]]) / 2 + 0.1, positions[parents[node]]])
+                                              for node in range(1, number_of_nodes)]})
+    streams = streams.iloc[rng.permutation(len(streams))].reset_index(drop=True)
+    streams['NHDPlusID'] = np.arange(len(streams)) + 1.0
+    streams['is_nwm_headwater'] = ~streams['FromNode'].isin(streams['ToNode'])
+
+    return(streams)
+
+
+def check_dissolve_links():
+
+    rng = np.random.default_rng(5)
+    for trial in range(200):
+        streams = random_stream_tree(rng)
+
+        link_numbers, link_geometries = dissolve_links(streams)
+        old_link_geometries, old_link_numbers = dissolve_links_by_bfs(streams)
+
+        # same links as the links streams kept before, without the orphaned ones
+        assert sorted(g.wkb for g in link_geometries) == sorted(old_link_geometries[n].wkb for n in old_link_numbers), trial
+
+        # headwater links keep their numbers and the rest are numbered consecutively after them
+        number_of_headwaters = streams['is_nwm_headwater'].sum()
+        assert list(link_numbers) == list(range(1, len(link_geometries) + 1)), trial
+        for link_number, link_geometry in zip(link_numbers[:number_of_headwaters], link_geometries[:number_of_headwaters]):
+            assert link_geometry.equals_exact(old_link_geometries[link_number], 0), trial
+
+    # a cycle gives a warning instead of stopping
+    streams = gpd.GeoDataFrame({'NHDPlusID' : [1.0, 2.0, 3.0, 4.0],
+                                'FromNode' : [1.0, 2.0, 3.0, 4.0],
+                                'ToNode' : [2.0, 3.0, 4.0, 2.0],
+                                'is_nwm_headwater' : [True, False, False, False],
+                                'geometry' : [LineString([(0, 0), (1, 0)]), LineString([(1, 0), (2, 0)]), LineString([(2, 0), (2, 1)]), LineString([(2, 1), (1, 0)])]})
+    link_numbers, link_geometries = dissolve_links(streams)
+    assert sum(len(g.coords) for g in link_geometries) == sum(len(g.coords) for g in streams.geometry)
+
+    print("Links match the previous dissolve on {} networks".format(trial + 1))
+
+
+if __name__ == '__main__':
+
+    check_trace_nwm_streams()
+    check_dissolve_links()
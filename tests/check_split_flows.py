@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import geopandas as gpd
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import LineString, Point, box
+
+# lib/utils, not tests/utils
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from split_flows import split_flows, split_line_at_vertices
+
+
+def split_line_by_rebuilding(lineString, maxLength):
+    """
+    Vertex splitting as split_flows.py did it before split_line_at_vertices, rebuilding a LineString at every vertex.
+    It emits the last segment twice when the final cut lands on the last vertex.
+    """
+
+    segments = []
+    if lineString.length == 0:
+        return(segments)
+    if lineString.length < maxLength:
+        return([lineString])
+
+    splitLength = lineString.length / np.ceil(lineString.length / maxLength)
+
+    cumulative_line = []
+    last_point = []
+    last_point_in_entire_lineString = list(zip(*lineString.coords.xy))[-1]
+    for point in zip(*lineString.coords.xy):
+        cumulative_line = cumulative_line + [point]
+        if last_point:
+            cumulative_line = [last_point] + cumulative_line
+        elif len(cumulative_line) == 1:
+            continue
+
+        if LineString(cumulative_line).length >= splitLength:
+            segments.append(LineString(cumulative_line))
+            last_point = cumulative_line[-1]
+            if last_point == last_point_in_entire_lineString:
+                continue
+            cumulative_line = []
+
+    segments.append(LineString(cumulative_line))
+
+    return(segments)
+
+
+def drop_repeated_vertices(lineString):
+    coordinates = np.array(lineString.coords)
+    return(LineString(coordinates[np.r_[True, np.any(np.diff(coordinates, axis=0) != 0, axis=1)]]))
+
+
+def check_final_cut_on_last_vertex():
+
+    # the split length is 10 so the second cut lands exactly on the last vertex
+    line_coordinates = np.array([[0.0, 0.0], [10.0, 0.0], [20.0, 0.0]])
+    segments = split_line_at_vertices(line_coordinates, 10.0)
+
+    old_segments = split_line_by_rebuilding(LineString(line_coordinates), 10.0)
+    assert len(old_segments) == 3 and old_segments[-1].equals(old_segments[-2])
+
+    assert len(segments) == 2
+    np.testing.assert_array_equal(segments[0], line_coordinates[:2])
+    np.testing.assert_array_equal(segments[1], line_coordinates[1:])
+    print("Final cut on the last vertex gives no duplicate segment")
+
+
+def check_matches_rebuilding():
+
+    rng = np.random.default_rng(0)
+    duplicates_dropped = 0
+    for trial in range(2000):
+        line_coordinates = np.cumsum(rng.normal(size=(rng.integers(2, 60), 2)) * rng.uniform(1, 200), axis=0)
+        maxLength = rng.uniform(50, 2000)
+
+        segments = [LineString(s) for s in split_line_at_vertices(line_coordinates, maxLength)]
+        old_segments = [drop_repeated_vertices(s) for s in split_line_by_rebuilding(LineString(line_coordinates), maxLength)]
+
+        # the only difference is the duplicated last segment
+        if (len(old_segments) == len(segments) + 1) and old_segments[-1].equals(old_segments[-2]):
+            old_segments = old_segments[:-1]
+            duplicates_dropped += 1
+
+        assert len(segments) == len(old_segments), trial
+        assert all(s.equals_exact(o, 0) for s, o in zip(segments, old_segments)), trial
+        assert not any(s.equals(t) for s, t in zip(segments[:-1], segments[1:])), trial
+
+        # segments chain end to start and cover the line
+        for s, t in zip(segments[:-1], segments[1:]):
+            assert s.coords[-1] == t.coords[0], trial
+        assert np.isclose(sum(s.length for s in segments), LineString(line_coordinates).length), trial
+
+    print("Segments match the previous splitting on {} lines, {} duplicate last segments dropped".format(trial + 1, duplicates_dropped))
+
+
+def check_numbering_independent_of_workers():
+
+    rng = np.random.default_rng(1)
+    work_dir = tempfile.mkdtemp()
+    try:
+        dem_fileName = os.path.join(work_dir, 'dem.tif')
+        dem = rng.uniform(0, 50, (200, 200)).astype(np.float32)
+        with rasterio.open(dem_fileName, 'w', driver='GTiff', height=200, width=200, count=1, dtype='float32',
+                           crs='EPSG:5070', transform=from_origin(0, 2000, 10, 10), nodata=-9999) as dst:
+            dst.write(dem, 1)
+
+        # four HUC8s so reaches are split in several partitions
+        WBD8 = gpd.GeoDataFrame({'fossid' : ['1001', '1002', '1003', '1004']},
+                                geometry=[box(0, 0, 1000, 1000), box(1000, 0, 2000, 1000), box(0, 1000, 1000, 2000), box(1000, 1000, 2000, 2000)],
+                                crs='EPSG:5070')
+        flows = gpd.GeoDataFrame(geometry=[LineString(np.clip(np.cumsum(rng.normal(size=(rng.integers(2, 30), 2)) * 60, axis=0) + rng.uniform(200, 1800, 2), 1, 1999))
+                                           for _ in range(120)], crs='EPSG:5070')
+        lakes = gpd.GeoDataFrame({'newID' : np.arange(5) + 100},
+                                 geometry=[Point(*rng.uniform(200, 1800, 2)).buffer(rng.uniform(50, 150)) for _ in range(5)], crs='EPSG:5070')
+
+        outputs = [split_flows(flows, dem_fileName, 250, 0.001, WBD8, lakes, num_workers) for num_workers in (1, 3)]
+    finally:
+        shutil.rmtree(work_dir)
+
+    (flows_1, points_1), (flows_3, points_3) = outputs
+    assert len(flows_1) > len(flows)
+    for gdf_1, gdf_3 in ((flows_1, flows_3), (points_1, points_3)):
+        assert list(gdf_1.columns) == list(gdf_3.columns)
+        assert [g.wkb for g in gdf_1.geometry] == [g.wkb for g in gdf_3.geometry]
+        attributes_1, attributes_3 = gdf_1.drop(columns='geometry'), gdf_3.drop(columns='geometry')
+        assert attributes_1.equals(attributes_3), attributes_1.compare(attributes_3)
+    print("Split flows and HydroIDs match with 1 and 3 workers ({} segments)".format(len(flows_1)))
+
+
+if __name__ == '__main__':
+
+    check_final_cut_on_last_vertex()
+    check_matches_rebuilding()
+    check_numbering_independent_of_workers()
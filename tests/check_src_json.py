@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+# lib/utils, not tests/utils
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from utils.shared_functions import write_src_json
+
+
+def write_src_json_by_dict(output_src, output_src_json_fileName):
+    """ src.json as add_crosswalk.py built it before write_src_json, one boolean scan per HydroID into a dict """
+
+    output_src_json = dict()
+    for hid in np.unique(output_src['HydroID']):
+        indices_of_hid = output_src['HydroID'] == hid
+        stage_list = output_src['Stage'][indices_of_hid].astype(float).tolist()
+        q_list = output_src['Discharge (m3s-1)'][indices_of_hid].astype(float).tolist()
+        output_src_json[str(hid)] = { 'q_list' : q_list , 'stage_list' : stage_list }
+
+    with open(output_src_json_fileName, 'w') as f:
+        json.dump(output_src_json, f, sort_keys=True, indent=2)
+
+
+def check_src_json():
+
+    rng = np.random.default_rng(3)
+    work_dir = tempfile.mkdtemp()
+    try:
+        for trial in range(50):
+            # HydroIDs with different digit counts sort differently as strings and as numbers
+            number_of_rows = 0 if trial == 0 else rng.integers(1, 200)
+            output_src = pd.DataFrame({'HydroID' : rng.choice([5, 9, 10, 11, 100, 1230002, 12340001], number_of_rows),
+                                       'Stage' : rng.uniform(0, 5, number_of_rows).round(4),
+                                       'Discharge (m3s-1)' : rng.uniform(0, 100, number_of_rows)})
+
+            src_json_fileName = os.path.join(work_dir, 'src.json')
+            old_src_json_fileName = os.path.join(work_dir, 'src_old.json')
+            write_src_json(output_src, src_json_fileName)
+            write_src_json_by_dict(output_src, old_src_json_fileName)
+
+            with open(src_json_fileName, 'rb') as f, open(old_src_json_fileName, 'rb') as f_old:
+                assert f.read() == f_old.read(), trial
+    finally:
+        shutil.rmtree(work_dir)
+
+    print("src.json is byte identical to the previous writer on {} tables".format(trial + 1))
+
+
+if __name__ == '__main__':
+
+    check_src_json()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import LineString
+
+# lib/utils, not tests/utils
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+from buildstreamtraversal import BuildStreamTraversalColumns
+
+
+def next_down_ids_by_loop(from_nodes, to_nodes, hydroIDs):
+    """ NextDownID as buildstreamtraversal.py found it before the join, the first segment in table order or -1 """
+
+    dnodes = dict()
+    for from_node, hydroID in zip(from_nodes, hydroIDs):
+        dnodes.setdefault(from_node, []).append(hydroID)
+
+    return([dnodes[to_node][0] if to_node in dnodes else -1 for to_node in to_nodes])
+
+
+def nodes_by_loop(geometries):
+    """ From and To nodes as buildstreamtraversal.py numbered them before factorization, in order of first use """
+
+    xy_dict = {}
+    from_nodes, to_nodes = [], []
+    for geometry in geometries:
+        for nodes, (x, y) in ((from_nodes, geometry.coords[0][:2]), (to_nodes, geometry.coords[-1][:2])):
+            key = '{},{}'.format(round(x, 7), round(y, 7))
+            if key not in xy_dict:
+                xy_dict[key] = len(xy_dict) + 1
+            nodes.append(xy_dict[key])
+
+    return(from_nodes, to_nodes)
+
+
+def random_network(rng):
+
+    number_of_segments = rng.integers(2, 80)
+    nodes = rng.uniform(0, 100, size=(rng.integers(2, 40), 2)).round(3)
+
+    geometries = []
+    for i in range(number_of_segments):
+        a, b = rng.choice(len(nodes), 2, replace=False)
+        geometries.append(LineString([nodes[a], (nodes[a] + nodes[b]) / 2 + rng.normal(size=2), nodes[b]]))
+    hydroIDs = rng.permutation(np.arange(10000001, 10000001 + number_of_segments))
+
+    return(gpd.GeoDataFrame({'HydroID' : hydroIDs, 'geometry' : geometries}, crs='EPSG:5070'))
+
+
+def check_next_down_ids():
+
+    rng = np.random.default_rng(1)
+    for trial in range(200):
+        streams = random_network(rng)
+        # nodes shared by several segments give confluences and splits
+        streams['From_Node'] = rng.integers(1, 30, len(streams))
+        streams['To_Node'] = rng.integers(1, 30, len(streams))
+
+        result = BuildStreamTraversalColumns().execute(streams.copy(), None, 'HydroID')
+        assert result[0] == 'OK', result[0]
+        streams_out = result[1]
+
+        expected = next_down_ids_by_loop(streams['From_Node'], streams['To_Node'], streams['HydroID'])
+        assert streams_out['NextDownID'].tolist() == expected, trial
+        assert streams_out['NextDownID'].dtype == object
+
+    print("NextDownID matches the previous loop on {} networks".format(trial + 1))
+
+
+def check_nodes():
+
+    rng = np.random.default_rng(2)
+    for trial in range(200):
+        streams = random_network(rng)
+        # end points that only agree after rounding to 7 decimals
+        streams['geometry'] = [LineString([np.array(g.coords[0]) + rng.choice([0, 1e-9]), g.coords[1], g.coords[2]]) for g in streams.geometry]
+
+        result = BuildStreamTraversalColumns().execute(streams.copy(), None, 'HydroID')
+        assert result[0] == 'OK', result[0]
+        streams_out = result[1]
+
+        # nodes are numbered after sorting by HydroID
+        streams_sorted = streams.sort_values('HydroID')
+        from_nodes, to_nodes = nodes_by_loop(streams_sorted.geometry)
+        assert streams_out['HydroID'].tolist() == streams_sorted['HydroID'].tolist(), trial
+        assert streams_out['From_Node'].tolist() == from_nodes, trial
+        assert streams_out['To_Node'].tolist() == to_nodes, trial
+        assert (streams_out['From_Node'].dtype == object) and (streams_out['To_Node'].dtype == object)
+        assert streams_out['NextDownID'].tolist() == next_down_ids_by_loop(from_nodes, to_nodes, streams_sorted['HydroID']), trial
+
+    print("From and To nodes match the previous loop on {} networks".format(trial + 1))
+
+
+if __name__ == '__main__':
+
+    check_next_down_ids()
+    check_nodes()
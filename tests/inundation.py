@@ -39,7 +39,7 @@ def inundate(
     catchments : str or rasterio.DatasetReader
         File path to or rasterio dataset reader of Catchments raster. Must have the same CRS as REM raster
     hydro_table : str or pandas.DataFrame
-        File path to hydro-table csv or Pandas DataFrame object with correct indices and columns.
+        File path to hydro-table csv or parquet or Pandas DataFrame object with correct indices and columns.
     forecast : str or pandas.DataFrame
         File path to forecast csv or Pandas DataFrame with correct column names.
     hucs : str or fiona.Collection, optional
@@ -447,7 +447,11 @@ def __append_huc_code_to_file_name(fileName,hucCode):
 
 def __subset_hydroTable_to_forecast(hydroTable,forecast,subset_hucs=None):
 
-    if isinstance(hydroTable,str):
+    if isinstance(hydroTable,str) and hydroTable.endswith('.parquet'):
+        hydroTable = pd.read_parquet(hydroTable,columns=['HUC','feature_id','HydroID','stage','discharge_cms','LakeID'])
+        hydroTable = hydroTable.astype({'HUC':str,'feature_id':str,'HydroID':str})
+        hydroTable.set_index(['HUC','feature_id','HydroID'],inplace=True)
+    elif isinstance(hydroTable,str):
         hydroTable = pd.read_csv(
                                  hydroTable,
                                  dtype={'HUC':str,'feature_id':str,